@@ -0,0 +1,90 @@
+import psycopg2
+import gzip
+import os
+import re
+import sys
+from datetime import date
+
+DATABASE_URL = os.getenv('DATABASE_URL')
+ARCHIVE_DIR = os.getenv('ORDER_ARCHIVE_DIR', 'archives')
+ARCHIVE_AFTER_MONTHS = int(os.getenv('ORDER_ARCHIVE_AFTER_MONTHS', 12))
+
+PARTITION_PATTERN = re.compile(r'^orders_(\d{4})_(\d{2})$')
+
+def cutoff_month(months):
+    """First day of the oldest month that stays in the live orders table"""
+    total = date.today().year * 12 + date.today().month - 1 - months
+    return date(total // 12, total % 12 + 1, 1)
+
+def find_cold_partitions(cursor, cutoff):
+    """Monthly order partitions (attached or already detached) older than cutoff"""
+    cursor.execute('''
+        SELECT c.relname, c.relispartition FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = current_schema() AND c.relkind = 'r' AND c.relname LIKE 'orders\\_%'
+        ORDER BY c.relname
+    ''')
+    cold = []
+    for name, attached in cursor.fetchall():
+        match = PARTITION_PATTERN.match(name)
+        if match and date(int(match.group(1)), int(match.group(2)), 1) < cutoff:
+            cold.append((name, attached))
+    return cold
+
+def archive_orders(months=ARCHIVE_AFTER_MONTHS, keep_tables=False):
+    """Detach order partitions older than months and write them to compressed CSV files"""
+
+    if not DATABASE_URL:
+        print("❌ DATABASE_URL environment variable is not set!")
+        return False
+
+    try:
+        conn = psycopg2.connect(DATABASE_URL)
+        cursor = conn.cursor()
+
+        if not os.path.exists(ARCHIVE_DIR):
+            os.makedirs(ARCHIVE_DIR)
+
+        cutoff = cutoff_month(months)
+        partitions = find_cold_partitions(cursor, cutoff)
+        if not partitions:
+            print(f"✅ No order partitions older than {cutoff} to archive")
+            conn.close()
+            return True
+
+        for name, attached in partitions:
+            # Detach first so live queries stop seeing the partition; a failed
+            # run leaves it detached and the next run picks it up again
+            if attached:
+                cursor.execute(f'ALTER TABLE orders DETACH PARTITION {name}')
+                conn.commit()
+                print(f"✅ Detached {name}")
+
+            cursor.execute(f'SELECT COUNT(*) FROM {name}')
+            row_count = cursor.fetchone()[0]
+
+            archive_file = f'{ARCHIVE_DIR}/{name}.csv.gz'
+            with gzip.open(archive_file + '.tmp', 'wb') as f:
+                cursor.copy_expert(f'COPY (SELECT * FROM {name} ORDER BY id) TO STDOUT WITH CSV HEADER', f)
+            os.replace(archive_file + '.tmp', archive_file)
+            print(f"✅ {name}: {row_count} orders → {archive_file}")
+
+            if not keep_tables:
+                cursor.execute(f'DROP TABLE {name}')
+                conn.commit()
+                print(f"🗑️ Dropped {name}")
+
+        conn.close()
+        print(f"✅ Archive complete! {len(partitions)} partitions older than {cutoff}")
+        return True
+
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        return False
+
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    months = int(args[0]) if args else ARCHIVE_AFTER_MONTHS
+
+    print(f"\n📦 ARCHIVING ORDERS OLDER THAN {months} MONTHS...\n")
+    archive_orders(months, keep_tables='--keep-tables' in sys.argv)
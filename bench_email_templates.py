@@ -0,0 +1,70 @@
+import json
+import sys
+import time
+from datetime import datetime
+
+from email_templates import (
+    ORDER_EMAIL_TEMPLATE, render_order_email, render_digest_email, render_items, text,
+)
+
+SAMPLE_ORDER = {
+    'orderid': 'AMC1A2B3C4D',
+    'firstName': 'Ravi',
+    'lastName': 'Kumar',
+    'phoneNo': '+91 98765 43210',
+    'email': 'ravi@example.com',
+    'address': '12, Gandhi Street, T. Nagar',
+    'city': 'Chennai',
+    'pincode': '600017',
+    'deliveryType': 'Express',
+    'paymentMethod': 'UPI',
+    'items': json.dumps([
+        {'productId': 1, 'name': 'Chicken Curry Cut', 'weight': '1kg', 'quantity': 2, 'unitPrice': 280, 'lineTotal': 560},
+        {'productId': 2, 'name': 'Mutton Boneless', 'weight': '500gm', 'quantity': 1, 'unitPrice': 470, 'lineTotal': 470},
+        {'productId': 5, 'name': 'Chicken Liver', 'weight': '500gm', 'quantity': 3, 'unitPrice': 90, 'lineTotal': 270},
+    ]),
+    'subtotal': 1300,
+    'discount': 50,
+    'total': 1250,
+    'promocode': 'SAVE50',
+}
+
+def format_each_time(order_data):
+    """Baseline: parse and fill the full template with str.format on every call"""
+    return ORDER_EMAIL_TEMPLATE.format(
+        order_id=text(order_data['orderid']),
+        received_at=datetime.now().strftime('%d-%m-%Y %H:%M:%S'),
+        first_name=text(order_data.get('firstName')),
+        last_name=text(order_data.get('lastName')),
+        email=text(order_data.get('email'), 'N/A'),
+        phone=text(order_data.get('phoneNo')),
+        city=text(order_data.get('city')),
+        address=text(order_data.get('address')),
+        pincode=text(order_data.get('pincode')),
+        items_html=render_items(order_data),
+        subtotal=text(order_data.get('subtotal')),
+        delivery_type=text(order_data.get('deliveryType'), 'Standard'),
+        payment_method=text(order_data.get('paymentMethod'), 'N/A'),
+        promo_html='',
+        total=text(order_data.get('total')),
+    )
+
+def bench(name, func, iterations):
+    """Run func iterations times and print renders per second"""
+    func()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    elapsed = time.perf_counter() - started
+    print(f"{name:<32} {iterations / elapsed:>12,.0f} renders/s   {elapsed / iterations * 1e6:>8.1f} µs/render")
+
+if __name__ == '__main__':
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    digest_orders = [(datetime.now(), SAMPLE_ORDER)] * 50
+
+    print(f"\n📊 EMAIL TEMPLATE BENCHMARK ({iterations} iterations)\n")
+    print(f"Order email size: {len(render_order_email(SAMPLE_ORDER).encode())} bytes "
+          f"(uncompiled: {len(format_each_time(SAMPLE_ORDER).encode())} bytes)\n")
+    bench("str.format each time", lambda: format_each_time(SAMPLE_ORDER), iterations)
+    bench("compiled order email", lambda: render_order_email(SAMPLE_ORDER), iterations)
+    bench("compiled digest (50 orders)", lambda: render_digest_email(digest_orders), max(1, iterations // 50))
@@ -0,0 +1,134 @@
+import os
+import socket
+import sys
+import threading
+import time
+import urllib.request
+
+# Small limits so the check runs in seconds; set before server reads its config
+os.environ.setdefault('REQUEST_IDLE_TIMEOUT_SECONDS', '1')
+os.environ.setdefault('REQUEST_READ_TIMEOUT_SECONDS', '3')
+os.environ.setdefault('LOG_LEVEL', 'CRITICAL')
+
+import server
+
+IDLE_TIMEOUT = server.REQUEST_IDLE_TIMEOUT_SECONDS
+READ_TIMEOUT = server.REQUEST_READ_TIMEOUT_SECONDS
+# Scheduling slack allowed on top of each deadline
+SLACK_SECONDS = 1.5
+
+def open_socket(port):
+    sock = socket.create_connection(('127.0.0.1', port))
+    sock.settimeout(READ_TIMEOUT + 10)
+    return sock
+
+def read_response(sock):
+    """Status line the server sent before closing, or '' if it closed without one"""
+    data = b''
+    try:
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    except ConnectionResetError:
+        pass
+    return data.split(b'\r\n', 1)[0].decode(errors='replace')
+
+def trickle_headers(port, results):
+    """Send a header one byte at a time, each gap shorter than the idle timeout"""
+    started = time.monotonic()
+    sock = open_socket(port)
+    try:
+        for byte in b'GET /api/health HTTP/1.1\r\nHost: localhost\r\nX-Slow: ' + b'a' * 1000:
+            sock.sendall(bytes([byte]))
+            time.sleep(IDLE_TIMEOUT / 2)
+        results.append(('trickling headers', time.monotonic() - started, 'never cut off', READ_TIMEOUT))
+    except OSError:
+        results.append(('trickling headers', time.monotonic() - started, 'closed', READ_TIMEOUT))
+    finally:
+        sock.close()
+
+def stall_body(port, results):
+    """Send headers and part of the body, then go quiet"""
+    started = time.monotonic()
+    sock = open_socket(port)
+    try:
+        sock.sendall(b'POST /api/orders HTTP/1.1\r\nHost: localhost\r\nContent-Length: 100\r\n\r\n{"items"')
+        status = read_response(sock) or 'closed'
+    except OSError:
+        status = 'closed'
+    finally:
+        sock.close()
+    results.append(('stalled body', time.monotonic() - started, status, IDLE_TIMEOUT))
+
+def stay_idle(port, results):
+    """Connect and never send anything"""
+    started = time.monotonic()
+    sock = open_socket(port)
+    try:
+        status = read_response(sock) or 'closed'
+    except OSError:
+        status = 'closed'
+    finally:
+        sock.close()
+    results.append(('idle connection', time.monotonic() - started, status, IDLE_TIMEOUT))
+
+def check_slow_clients(slow_clients=20):
+    """Serve /api/health while slow clients hold connections; return a list of failures"""
+    httpd = server.APIServer(('127.0.0.1', 0), server.APIHandler)
+    port = httpd.server_address[1]
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+
+    results = []
+    attackers = [
+        threading.Thread(target=target, args=(port, results))
+        for target in (trickle_headers, stall_body, stay_idle)
+        for _ in range(slow_clients)
+    ]
+    for thread in attackers:
+        thread.start()
+
+    ok = 0
+    errors = []
+    latencies = []
+    deadline = time.monotonic() + READ_TIMEOUT + SLACK_SECONDS
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/api/health', timeout=5) as response:
+                response.read()
+            ok += 1
+        except Exception as e:
+            errors.append(repr(e))
+        latencies.append(time.monotonic() - started)
+
+    for thread in attackers:
+        thread.join()
+    httpd.shutdown()
+    httpd.server_close()
+
+    failures = [f"health request failed: {error}" for error in errors]
+    if not ok:
+        failures.append("no health request succeeded")
+    print(f"✅ {ok} health requests alongside {len(attackers)} slow clients, "
+          f"max latency {max(latencies) * 1000:.0f}ms")
+
+    late = []
+    for name, elapsed, status, limit in sorted(results):
+        line = f"{name} ({status} after {elapsed:.2f}s, limit {limit:g}s)"
+        if status != 'closed' and status.split(' ')[1:2] != ['408']:
+            late.append(f"{line}: expected 408 or a closed connection")
+        elif elapsed > limit + SLACK_SECONDS:
+            late.append(f"{line}: cut off too late")
+    print(f"✅ {len(results) - len(late)} of {len(results)} slow clients cut off in time")
+    return failures + late
+
+if __name__ == '__main__':
+    slow_clients = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+    print(f"\n🐢 SLOW CLIENT CHECK (idle timeout {IDLE_TIMEOUT:g}s, read timeout {READ_TIMEOUT:g}s)\n")
+    failures = check_slow_clients(slow_clients)
+    for failure in failures:
+        print(f"❌ {failure}")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,278 @@
+import json
+import string
+from datetime import datetime
+from html import escape
+
+# ============ EMAIL TEMPLATES ============
+# Templates are parsed once at import into literal chunks and field slots, so
+# rendering an email is a list fill and a single join.
+
+EMAIL_STYLES = """
+body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
+.container {{ max-width: 600px; margin: 0 auto; background: #f9f9f9; padding: 20px; border-radius: 8px; }}
+.header {{ background: #d32f2f; color: white; padding: 20px; border-radius: 8px 8px 0 0; text-align: center; }}
+.header h2 {{ margin: 0; }}
+.content {{ background: white; padding: 20px; }}
+.section {{ margin-bottom: 20px; padding-bottom: 20px; border-bottom: 1px solid #eee; }}
+.section h3 {{ color: #d32f2f; margin-top: 0; }}
+.info-row {{ display: flex; justify-content: space-between; margin: 8px 0; }}
+.label {{ font-weight: bold; color: #666; }}
+.value {{ text-align: right; }}
+.items-list {{ list-style: none; padding: 0; }}
+.items-list li {{ padding: 8px; background: #f5f5f5; margin: 5px 0; border-radius: 4px; }}
+.total {{ font-size: 1.3em; font-weight: bold; color: #d32f2f; text-align: right; padding: 15px 0; }}
+.status {{ display: inline-block; padding: 8px 12px; background: #fff3e0; color: #e65100; border-radius: 4px; font-weight: bold; }}
+.orders-table {{ width: 100%; border-collapse: collapse; }}
+.orders-table th, .orders-table td {{ padding: 8px; border-bottom: 1px solid #eee; text-align: left; }}
+.footer {{ text-align: center; color: #999; font-size: 0.9em; margin-top: 20px; border-top: 1px solid #eee; padding-top: 20px; }}
+"""
+
+ORDER_EMAIL_TEMPLATE = """
+<html>
+    <head>
+        <style>""" + EMAIL_STYLES + """</style>
+    </head>
+    <body>
+        <div class="container">
+            <div class="header">
+                <h2>📦 New Order Received!</h2>
+            </div>
+
+            <div class="content">
+                <div class="section">
+                    <h3>Order Information</h3>
+                    <div class="info-row">
+                        <span class="label">Order ID:</span>
+                        <span class="value"><strong>{order_id}</strong></span>
+                    </div>
+                    <div class="info-row">
+                        <span class="label">Date & Time:</span>
+                        <span class="value">{received_at}</span>
+                    </div>
+                    <div class="info-row">
+                        <span class="label">Status:</span>
+                        <span class="value"><span class="status">PENDING</span></span>
+                    </div>
+                </div>
+
+                <div class="section">
+                    <h3>Customer Information</h3>
+                    <div class="info-row">
+                        <span class="label">Name:</span>
+                        <span class="value">{first_name} {last_name}</span>
+                    </div>
+                    <div class="info-row">
+                        <span class="label">Email:</span>
+                        <span class="value">{email}</span>
+                    </div>
+                    <div class="info-row">
+                        <span class="label">Phone:</span>
+                        <span class="value">{phone}</span>
+                    </div>
+                    <div class="info-row">
+                        <span class="label">City:</span>
+                        <span class="value">{city}</span>
+                    </div>
+                </div>
+
+                <div class="section">
+                    <h3>Delivery Address</h3>
+                    <div style="background: #f5f5f5; padding: 12px; border-radius: 4px;">
+                        <p style="margin: 0;">{address}</p>
+                        <p style="margin: 8px 0 0 0;"><strong>{city} - {pincode}</strong></p>
+                    </div>
+                </div>
+
+                <div class="section">
+                    <h3>Order Items</h3>
+                    <ul class="items-list">
+                        {items_html}
+                    </ul>
+                </div>
+
+                <div class="section">
+                    <h3>Order Summary</h3>
+                    <div class="info-row">
+                        <span class="label">Subtotal:</span>
+                        <span class="value">₹{subtotal}</span>
+                    </div>
+                    <div class="info-row">
+                        <span class="label">Delivery Type:</span>
+                        <span class="value">{delivery_type}</span>
+                    </div>
+                    <div class="info-row">
+                        <span class="label">Payment Method:</span>
+                        <span class="value">{payment_method}</span>
+                    </div>
+                    {promo_html}
+                    <div class="total">
+                        Total Amount: ₹{total}
+                    </div>
+                </div>
+
+                <div class="footer">
+                    <p>This is an automated email from AMCMart Admin Panel.</p>
+                    <p>© 2025 AMCMart. All rights reserved.</p>
+                </div>
+            </div>
+        </div>
+    </body>
+</html>
+"""
+
+DIGEST_EMAIL_TEMPLATE = """
+<html>
+    <head>
+        <style>""" + EMAIL_STYLES + """</style>
+    </head>
+    <body>
+        <div class="container">
+            <div class="header">
+                <h2>📦 {order_count} New Orders Received</h2>
+            </div>
+
+            <div class="content">
+                <div class="section">
+                    <h3>Orders from {first_received_at} to {last_received_at}</h3>
+                    <table class="orders-table">
+                        <tr><th>Order ID</th><th>Customer</th><th>Phone</th><th>City</th><th>Lines</th><th>Total</th></tr>
+                        {rows_html}
+                    </table>
+                    <div class="total">
+                        Total Amount: ₹{total}
+                    </div>
+                </div>
+
+                <div class="footer">
+                    <p>Orders were grouped into one email because of high order volume.</p>
+                    <p>This is an automated email from AMCMart Admin Panel.</p>
+                    <p>© 2025 AMCMart. All rights reserved.</p>
+                </div>
+            </div>
+        </div>
+    </body>
+</html>
+"""
+
+ITEM_TEMPLATE = "<li>{name} ({weight}) x {quantity} = ₹{line_total}</li>"
+PROMO_TEMPLATE = '<div class="info-row"><span class="label">Promo Code:</span><span class="value">{code} (-₹{discount})</span></div>'
+DIGEST_ROW_TEMPLATE = "<tr><td><strong>{order_id}</strong></td><td>{name}</td><td>{phone}</td><td>{city}</td><td>{item_count}</td><td>₹{total}</td></tr>"
+
+class CompiledTemplate:
+    """A str.format-style template split once into literal chunks and field slots"""
+
+    def __init__(self, source):
+        # Drop indentation; it only adds bytes to every email
+        source = '\n'.join(line.strip() for line in source.strip().splitlines() if line.strip())
+        self.parts = []
+        self.slots = []
+        for literal, field, _, _ in string.Formatter().parse(source):
+            if literal:
+                self.parts.append(literal)
+            if field is not None:
+                self.slots.append((len(self.parts), field))
+                self.parts.append('')
+
+    def render(self, values):
+        """Fill the slots from values (already-escaped strings) and join"""
+        parts = self.parts.copy()
+        for index, field in self.slots:
+            parts[index] = values[field]
+        return ''.join(parts)
+
+ORDER_EMAIL = CompiledTemplate(ORDER_EMAIL_TEMPLATE)
+DIGEST_EMAIL = CompiledTemplate(DIGEST_EMAIL_TEMPLATE)
+ITEM = CompiledTemplate(ITEM_TEMPLATE)
+PROMO = CompiledTemplate(PROMO_TEMPLATE)
+DIGEST_ROW = CompiledTemplate(DIGEST_ROW_TEMPLATE)
+
+def text(value, default=''):
+    """HTML-escaped string for a template slot"""
+    return escape(str(default if value is None else value))
+
+def parse_items(items):
+    """Order items as a list, or None if they cannot be parsed"""
+    if isinstance(items, list):
+        return items
+    try:
+        parsed = json.loads(items or '[]')
+        return parsed if isinstance(parsed, list) else None
+    except (TypeError, ValueError):
+        return None
+
+def render_items(order_data):
+    items = parse_items(order_data.get('items'))
+    if items is None:
+        return f"<li>{text(order_data.get('items'))}</li>"
+
+    rendered = []
+    try:
+        for item in items:
+            quantity = item.get('quantity') or 0
+            line_total = item.get('lineTotal')
+            if line_total is None:
+                line_total = (item.get('unitPrice') or 0) * quantity
+            rendered.append(ITEM.render({
+                'name': text(item.get('name')),
+                'weight': text(item.get('weight')),
+                'quantity': text(quantity),
+                'line_total': text(line_total),
+            }))
+    except (AttributeError, TypeError):
+        return f"<li>{text(order_data.get('items'))}</li>"
+    return ''.join(rendered)
+
+def render_order_email(order_data, received_at=None):
+    """HTML body of the admin notification for one order"""
+    promocode = order_data.get('promocode')
+    promo_html = PROMO.render({
+        'code': text(promocode),
+        'discount': text(order_data.get('discount', 0)),
+    }) if promocode else ''
+
+    total = order_data.get('total', 0)
+    return ORDER_EMAIL.render({
+        'order_id': text(order_data['orderid']),
+        'received_at': (received_at or datetime.now()).strftime('%d-%m-%Y %H:%M:%S'),
+        'first_name': text(order_data.get('firstName')),
+        'last_name': text(order_data.get('lastName')),
+        'email': text(order_data.get('email'), 'N/A'),
+        'phone': text(order_data.get('phoneNo')),
+        'city': text(order_data.get('city')),
+        'address': text(order_data.get('address')),
+        'pincode': text(order_data.get('pincode')),
+        'items_html': render_items(order_data),
+        'subtotal': text(order_data.get('subtotal', total)),
+        'delivery_type': text(order_data.get('deliveryType'), 'Standard'),
+        'payment_method': text(order_data.get('paymentMethod'), 'N/A'),
+        'promo_html': promo_html,
+        'total': text(total, 0),
+    })
+
+def render_digest_email(orders):
+    """HTML body summarising several orders in one email
+
+    orders is a list of (received_at, order_data) tuples in arrival order.
+    """
+    rows = []
+    grand_total = 0
+    for _, order_data in orders:
+        total = order_data.get('total') or 0
+        grand_total += total
+        items = parse_items(order_data.get('items')) or []
+        rows.append(DIGEST_ROW.render({
+            'order_id': text(order_data.get('orderid')),
+            'name': text(f"{order_data.get('firstName') or ''} {order_data.get('lastName') or ''}".strip()),
+            'phone': text(order_data.get('phoneNo')),
+            'city': text(order_data.get('city')),
+            'item_count': text(len(items)),
+            'total': text(total),
+        }))
+
+    return DIGEST_EMAIL.render({
+        'order_count': text(len(orders)),
+        'first_received_at': orders[0][0].strftime('%d-%m-%Y %H:%M:%S'),
+        'last_received_at': orders[-1][0].strftime('%d-%m-%Y %H:%M:%S'),
+        'rows_html': ''.join(rows),
+        'total': text(grand_total),
+    })
@@ -1,22 +1,145 @@
 import os
 import json
 import psycopg2
+import psycopg2.pool
 from psycopg2.extras import RealDictCursor
-from http.server import HTTPServer, BaseHTTPRequestHandler
-from urllib.parse import urlparse, parse_qs
-from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, unquote
+from datetime import datetime, date, timedelta
+from zoneinfo import ZoneInfo
 import uuid
 import threading
+import time
+import base64
+import codecs
+import hashlib
+import http.client
+from collections import OrderedDict, deque
+import atexit
+import contextvars
+import csv
+import logging
+import logging.handlers
+import multiprocessing
+import queue
+import random
+import re
+import select
+import signal
+import socket
+import sys
+import zlib
 from sendgrid import SendGridAPIClient
 from sendgrid.helpers.mail import Mail
+from email_templates import render_order_email, render_digest_email, parse_items
+
+# ============ LOGGING CONFIGURATION ============
+# Records are queued on the request thread and written by a background
+# listener thread, so logging never blocks a request on stdout/stderr I/O.
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'WARNING').upper()
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+# Fraction of routine success messages (logged with extra={'sample': True}) that are kept
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', 0.1))
+
+# Correlation id of the request being handled on the current thread
+request_id_var = contextvars.ContextVar('request_id', default=None)
+
+class RequestContextFilter(logging.Filter):
+    """Attach the current request's correlation id to each record"""
+    
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+class SamplingFilter(logging.Filter):
+    """Keep only LOG_SAMPLE_RATE of the records marked with sample=True"""
+    
+    def filter(self, record):
+        if getattr(record, 'sample', False) and record.levelno < logging.WARNING:
+            return random.random() < LOG_SAMPLE_RATE
+        return True
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line"""
+    
+    RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'request_id', 'sample'}
+    
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.request_id:
+            entry["request_id"] = record.request_id
+        for key, value in vars(record).items():
+            if key not in self.RESERVED:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that drops records instead of blocking when the queue is full"""
+    
+    dropped = 0
+    
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+log_listener = None
+
+def configure_logging():
+    """Route the amcmart loggers through a bounded queue to a stderr writer thread"""
+    global log_listener
+    
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+    queue_handler.addFilter(SamplingFilter())
+    # Formatting happens on the calling thread; only the write is deferred
+    queue_handler.setFormatter(JsonFormatter())
+    
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(logging.Formatter('%(message)s'))
+    
+    root = logging.getLogger('amcmart')
+    root.handlers = [queue_handler]
+    root.setLevel(LOG_LEVEL)
+    root.propagate = False
+    
+    log_listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    log_listener.start()
+
+def stop_logging():
+    """Flush queued records and stop the writer thread"""
+    if log_listener:
+        log_listener.stop()
+
+configure_logging()
+atexit.register(stop_logging)
+# Forked workers need their own listener thread; threads do not survive fork
+os.register_at_fork(after_in_child=configure_logging)
+
+logger = logging.getLogger('amcmart')
+db_logger = logging.getLogger('amcmart.db')
+email_logger = logging.getLogger('amcmart.email')
+http_logger = logging.getLogger('amcmart.http')
 
 # ============ DATABASE CONFIGURATION ============
 DATABASE_URL = os.getenv('DATABASE_URL')
+# Connections kept open per process, and how long a request waits for a free one
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv('DB_POOL_TIMEOUT_SECONDS', 10))
 
 if not DATABASE_URL:
-    print("❌ ERROR: DATABASE_URL environment variable is not set!")
+    logger.error("DATABASE_URL environment variable is not set")
 else:
-    print(f"✅ Database URL configured: {DATABASE_URL[:50]}...")
+    logger.info("Database URL configured", extra={"database_url": f"{DATABASE_URL[:50]}..."})
 
 # ============ EMAIL CONFIGURATION ============
 SENDER_EMAIL = os.getenv('SENDER_EMAIL')
@@ -24,15 +147,298 @@ ADMIN_EMAIL = os.getenv('ADMIN_EMAIL')
 SENDGRID_API_KEY = os.getenv('SENDGRID_API_KEY')
 
 if SENDER_EMAIL and ADMIN_EMAIL and SENDGRID_API_KEY:
-    print(f"✅ Email configured")
-    print(f"   SENDER: {SENDER_EMAIL}")
-    print(f"   ADMIN (Receiver): {ADMIN_EMAIL}")
-    print(f"   SendGrid: ✅ Configured")
+    logger.info("Email configured", extra={"sender": SENDER_EMAIL, "admin": ADMIN_EMAIL})
 else:
-    print("⚠️ Email not fully configured")
-    print(f"   SENDER_EMAIL: {'✅' if SENDER_EMAIL else '❌'}")
-    print(f"   ADMIN_EMAIL: {'✅' if ADMIN_EMAIL else '❌'}")
-    print(f"   SENDGRID_API_KEY: {'✅' if SENDGRID_API_KEY else '❌'}")
+    logger.warning("Email not fully configured", extra={
+        "sender_email_set": bool(SENDER_EMAIL),
+        "admin_email_set": bool(ADMIN_EMAIL),
+        "sendgrid_api_key_set": bool(SENDGRID_API_KEY),
+    })
+
+# Group order emails into one digest per window once the order rate reaches
+# EMAIL_DIGEST_THRESHOLD orders per minute (0 disables digests)
+EMAIL_DIGEST_WINDOW_SECONDS = float(os.getenv('EMAIL_DIGEST_WINDOW_SECONDS', 60))
+EMAIL_DIGEST_THRESHOLD = int(os.getenv('EMAIL_DIGEST_THRESHOLD', 20))
+
+# ============ SYNC CONFIGURATION ============
+# Delta sync re-sends rows changed this many seconds before the client's token,
+# so rows from transactions that committed late are never skipped.
+SYNC_OVERLAP_SECONDS = int(os.getenv('SYNC_OVERLAP_SECONDS', 5))
+
+# ============ SERVER CONFIGURATION ============
+# Worker processes for the pre-fork launcher (1 = single process)
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', 1))
+WORKER_GRACEFUL_TIMEOUT_SECONDS = float(os.getenv('WORKER_GRACEFUL_TIMEOUT_SECONDS', 30))
+WORKER_RESTART_BACKOFF_SECONDS = float(os.getenv('WORKER_RESTART_BACKOFF_SECONDS', 1))
+# How long a rolling restart waits for a replacement worker to start listening
+WORKER_START_TIMEOUT_SECONDS = float(os.getenv('WORKER_START_TIMEOUT_SECONDS', 30))
+LISTEN_BACKLOG = int(os.getenv('LISTEN_BACKLOG', 128))
+# Slow-client limits: a client may go REQUEST_IDLE_TIMEOUT_SECONDS without sending
+# anything and must deliver the whole request (line, headers and body) within
+# REQUEST_READ_TIMEOUT_SECONDS of connecting
+REQUEST_IDLE_TIMEOUT_SECONDS = float(os.getenv('REQUEST_IDLE_TIMEOUT_SECONDS', 10))
+REQUEST_READ_TIMEOUT_SECONDS = float(os.getenv('REQUEST_READ_TIMEOUT_SECONDS', 30))
+MAX_HEADER_BYTES = int(os.getenv('MAX_HEADER_BYTES', 16 * 1024))
+MAX_BODY_BYTES = int(os.getenv('MAX_BODY_BYTES', 1024 * 1024))
+# Open connections per worker process (0 = unlimited); extra ones get a 503
+MAX_CONNECTIONS = int(os.getenv('MAX_CONNECTIONS', 500))
+
+# ============ ORDER PARTITIONING CONFIGURATION ============
+# Orders are range-partitioned by month on created_at. Partitions are kept
+# created this many months ahead of the current month.
+ORDER_PARTITION_MONTHS_AHEAD = int(os.getenv('ORDER_PARTITION_MONTHS_AHEAD', 3))
+ORDER_PARTITION_CHECK_SECONDS = int(os.getenv('ORDER_PARTITION_CHECK_SECONDS', 6 * 60 * 60))
+
+def month_start(day):
+    """First day of the month containing day"""
+    return date(day.year, day.month, 1)
+
+def next_month(day):
+    """First day of the month after day"""
+    return date(day.year + (day.month == 12), day.month % 12 + 1, 1)
+
+def order_partition_name(month):
+    """Partition table name for the month starting at month"""
+    return f"orders_{month.year:04d}_{month.month:02d}"
+
+# ============ PRICING CONFIGURATION ============
+# Product prices and promo codes are served from an in-memory snapshot that is
+# reloaded after any process changes them (via LISTEN/NOTIFY) and at least this often.
+PRICING_SNAPSHOT_TTL_SECONDS = int(os.getenv('PRICING_SNAPSHOT_TTL_SECONDS', 60))
+# Wait before reconnecting a dropped snapshot change listener
+SNAPSHOT_LISTEN_RETRY_SECONDS = float(os.getenv('SNAPSHOT_LISTEN_RETRY_SECONDS', 5))
+MAX_ITEM_QUANTITY = int(os.getenv('MAX_ITEM_QUANTITY', 50))
+
+# ============ IDEMPOTENCY CONFIGURATION ============
+# Responses to POST /api/orders with an Idempotency-Key header are replayed for
+# retries within this window; recent keys are also kept in a per-process LRU.
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv('IDEMPOTENCY_TTL_SECONDS', 24 * 60 * 60))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv('IDEMPOTENCY_CACHE_SIZE', 10000))
+# A claimed key whose request never stored a response (worker died, write failed)
+# can be claimed again after this many seconds
+IDEMPOTENCY_LEASE_SECONDS = int(os.getenv('IDEMPOTENCY_LEASE_SECONDS', 60))
+
+# ============ GROUP COMMIT CONFIGURATION ============
+# When enabled, concurrent order inserts are collected for up to MAX_WAIT_MS (or
+# MAX_BATCH rows) and committed in one transaction, sharing a single WAL flush.
+ORDER_GROUP_COMMIT = os.getenv('ORDER_GROUP_COMMIT', '').lower() in ('1', 'true', 'yes', 'on')
+ORDER_GROUP_COMMIT_MAX_WAIT_MS = float(os.getenv('ORDER_GROUP_COMMIT_MAX_WAIT_MS', 2))
+ORDER_GROUP_COMMIT_MAX_BATCH = int(os.getenv('ORDER_GROUP_COMMIT_MAX_BATCH', 50))
+
+# ============ EXPORT CONFIGURATION ============
+# Exports read EXPORT_FETCH_SIZE rows at a time from a server-side cursor and
+# write the body in chunks of about EXPORT_CHUNK_BYTES. Each running export holds
+# a pooled connection, so only EXPORT_MAX_CONCURRENT run at once per process.
+EXPORT_FETCH_SIZE = int(os.getenv('EXPORT_FETCH_SIZE', 2000))
+EXPORT_CHUNK_BYTES = int(os.getenv('EXPORT_CHUNK_BYTES', 64 * 1024))
+EXPORT_MAX_CONCURRENT = int(os.getenv('EXPORT_MAX_CONCURRENT', 2))
+
+# ============ DASHBOARD CONFIGURATION ============
+# Order counts, revenue and distinct customers are kept per hour and per day for
+# each dimension; charts read only these rollups. Triggers on orders queue each
+# change and the maintenance thread folds the queue in every ROLLUP_FOLD_SECONDS.
+ROLLUP_FOLD_SECONDS = float(os.getenv('ROLLUP_FOLD_SECONDS', 5))
+ROLLUP_GRANULARITIES = {'hour': timedelta(hours=1), 'day': timedelta(days=1)}
+ROLLUP_DIMENSIONS = ('all', 'city', 'category')
+TIMESERIES_DEFAULT_BUCKETS = {'hour': 48, 'day': 30}
+TIMESERIES_MAX_BUCKETS = int(os.getenv('TIMESERIES_MAX_BUCKETS', 1000))
+
+# ============ DELIVERY CONFIGURATION ============
+# Delivery zones (pincodes and rules) and slot bookings are held in memory. A
+# single process counts bookings in memory and writes the changes every
+# DELIVERY_FLUSH_SECONDS; with several workers each booking is claimed in the
+# database so workers cannot overbook a slot between them.
+DELIVERY_SNAPSHOT_TTL_SECONDS = int(os.getenv('DELIVERY_SNAPSHOT_TTL_SECONDS', 60))
+DELIVERY_FLUSH_SECONDS = float(os.getenv('DELIVERY_FLUSH_SECONDS', 1))
+DELIVERY_SLOT_REQUIRED = os.getenv('DELIVERY_SLOT_REQUIRED', '').lower() in ('1', 'true', 'yes', 'on')
+# Slot times, cutoffs and "today" are local to the shop, not to the host
+DELIVERY_TIMEZONE = ZoneInfo(os.getenv('DELIVERY_TIMEZONE', 'Asia/Kolkata'))
+
+class DateRange:
+    """Parse ?from=YYYY-MM-DD&to=YYYY-MM-DD filters on created_at"""
+    
+    @staticmethod
+    def parse(query):
+        """Return (start, end) datetimes; end is exclusive so to= includes that day"""
+        start = end = None
+        try:
+            if query.get('from'):
+                start = datetime.fromisoformat(query['from'][0])
+            if query.get('to'):
+                end = datetime.fromisoformat(query['to'][0])
+                if len(query['to'][0]) == 10:
+                    end += timedelta(days=1)
+        except ValueError:
+            raise ValueError("Invalid date range, use YYYY-MM-DD")
+        if start and end and start >= end:
+            raise ValueError("Invalid date range, 'from' must be before 'to'")
+        return start, end
+    
+    @staticmethod
+    def conditions(start, end, column='created_at'):
+        """SQL conditions and params for a (start, end) range, suitable for partition pruning"""
+        conditions, params = [], []
+        if start:
+            conditions.append(f'{column} >= %s')
+            params.append(start)
+        if end:
+            conditions.append(f'{column} < %s')
+            params.append(end)
+        return conditions, params
+
+class Pagination:
+    """Parse ?limit=&offset= query parameters"""
+    
+    @staticmethod
+    def parse(query, default_limit=20, max_limit=100):
+        """Return (limit, offset), raising ValueError if either is invalid"""
+        try:
+            limit = int(query.get('limit', [default_limit])[0])
+            offset = int(query.get('offset', [0])[0])
+        except ValueError:
+            raise ValueError("Invalid pagination, limit and offset must be integers")
+        if not 1 <= limit <= max_limit or offset < 0:
+            raise ValueError(f"Invalid pagination, limit must be 1-{max_limit} and offset non-negative")
+        return limit, offset
+    
+    @staticmethod
+    def page(rows, limit, offset):
+        """Trim a limit + 1 fetch to limit rows and describe the page"""
+        return rows[:limit], {"limit": limit, "offset": offset, "has_more": len(rows) > limit}
+
+# ============ CUSTOMER LOOKUP ============
+# Expressions shared by the lookup indexes and the queries that must match them.
+# Phone numbers are compared on their last 10 digits, ignoring +91, spaces and dashes.
+NORMALIZED_PHONE_SQL = "right(regexp_replace(COALESCE(phoneNo, ''), '[^0-9]', '', 'g'), 10)"
+CUSTOMER_NAME_SQL = "lower(COALESCE(firstName, '') || ' ' || COALESCE(lastName, ''))"
+
+def normalize_phone(phone):
+    """Last 10 digits of a phone number, matching NORMALIZED_PHONE_SQL"""
+    return re.sub(r'[^0-9]', '', phone or '')[-10:]
+
+def like_prefix(value):
+    """LIKE pattern matching strings that start with value"""
+    return re.sub(r'([\\%_])', r'\\\1', value) + '%'
+
+class ChangeToken:
+    """Opaque ?since= tokens wrapping the last updated_at a client has seen"""
+    
+    @staticmethod
+    def encode(timestamp):
+        """Encode an updated_at timestamp as a URL-safe token"""
+        if timestamp is None:
+            return None
+        raw = timestamp.isoformat().encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+    
+    @staticmethod
+    def decode(token):
+        """Decode a token back to a timestamp, raising ValueError if malformed"""
+        if not token:
+            return None
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            raw = base64.urlsafe_b64decode(padded.encode()).decode()
+            return datetime.fromisoformat(raw)
+        except Exception:
+            raise ValueError("Invalid sync token")
+    
+    @staticmethod
+    def latest(rows, fallback=None):
+        """Token for the newest updated_at among rows (or the fallback timestamp)"""
+        stamps = [row['updated_at'] for row in rows if row.get('updated_at')]
+        if fallback:
+            stamps.append(fallback)
+        return ChangeToken.encode(max(stamps) if stamps else None)
+
+# ============ ORDER EXPORT ============
+# Exports have one record per order line item: the order columns repeated,
+# followed by the line's product fields.
+EXPORT_ORDER_COLUMNS = [
+    'orderid', 'created_at', 'status', 'firstname', 'lastname', 'phoneno', 'email', 'address',
+    'city', 'pincode', 'deliverytype', 'delivery_date', 'delivery_slot', 'paymentmethod', 'promocode', 'total',
+]
+EXPORT_LINE_COLUMNS = ['line_no', 'product_id', 'product_name', 'weight', 'quantity', 'unit_price', 'line_total']
+
+def order_lines(order):
+    """Flatten an order row into export records, one per line item
+
+    Orders with no parseable items still export one record with blank line fields.
+    """
+    base = {column: order.get(column) for column in EXPORT_ORDER_COLUMNS}
+    lines = []
+    for line_no, item in enumerate(parse_items(order.get('items')) or [], 1):
+        if not isinstance(item, dict):
+            continue
+        quantity = item.get('quantity')
+        unit_price = item.get('unitPrice')
+        line_total = item.get('lineTotal')
+        if line_total is None and isinstance(quantity, (int, float)) and isinstance(unit_price, (int, float)):
+            line_total = quantity * unit_price
+        lines.append({
+            **base,
+            'line_no': line_no,
+            'product_id': item.get('productId'),
+            'product_name': item.get('name'),
+            'weight': item.get('weight'),
+            'quantity': quantity,
+            'unit_price': unit_price,
+            'line_total': line_total,
+        })
+    return lines or [{**base, **dict.fromkeys(EXPORT_LINE_COLUMNS)}]
+
+# Spreadsheets run cells starting with these as formulas
+CSV_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+def csv_safe(record):
+    """Copy of record with text that a spreadsheet would run as a formula prefixed with '"""
+    return {
+        key: f"'{value}" if isinstance(value, str) and value.startswith(CSV_FORMULA_PREFIXES) else value
+        for key, value in record.items()
+    }
+
+class ResponseStream:
+    """File-like writer for a streamed response body, with optional gzip and chunked framing"""
+
+    def __init__(self, wfile, chunked, compress, chunk_bytes=EXPORT_CHUNK_BYTES):
+        self.wfile = wfile
+        self.chunked = chunked
+        self.compressor = zlib.compressobj(wbits=31) if compress else None
+        self.chunk_bytes = chunk_bytes
+        self.buffer = []
+        self.size = 0
+
+    def write(self, text):
+        data = text.encode()
+        self.buffer.append(data)
+        self.size += len(data)
+        if self.size >= self.chunk_bytes:
+            self.flush()
+
+    def flush(self):
+        data = b''.join(self.buffer)
+        self.buffer = []
+        self.size = 0
+        if self.compressor:
+            data = self.compressor.compress(data)
+        self.send(data)
+
+    def send(self, data):
+        # An empty chunk would end a chunked body early
+        if not data:
+            return
+        if self.chunked:
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+        else:
+            self.wfile.write(data)
+
+    def close(self):
+        """Write buffered data, the gzip trailer and the final empty chunk"""
+        self.flush()
+        if self.compressor:
+            self.send(self.compressor.flush())
+        if self.chunked:
+            self.wfile.write(b'0\r\n\r\n')
 
 class EmailService:
     """Handle email notifications using SendGrid"""
@@ -41,216 +447,277 @@ class EmailService:
     def send_order_notification(order_data):
         """Send order notification email to admin"""
         try:
-            print(f"\n{'='*60}")
-            print(f"📧 SENDGRID EMAIL SERVICE STARTING")
-            print(f"{'='*60}")
-            
             # Get credentials from environment
             sendgrid_api_key = os.getenv('SENDGRID_API_KEY')
             sender_email = os.getenv('SENDER_EMAIL')
             admin_email = os.getenv('ADMIN_EMAIL')
             
             if not sendgrid_api_key or not sender_email or not admin_email:
-                print(f"❌ SENDGRID NOT CONFIGURED")
-                print(f"   SENDGRID_API_KEY: {'SET' if sendgrid_api_key else 'NOT SET'}")
-                print(f"   SENDER_EMAIL: {'SET' if sender_email else 'NOT SET'}")
-                print(f"   ADMIN_EMAIL: {'SET' if admin_email else 'NOT SET'}")
+                email_logger.warning("SendGrid not configured, skipping order email", extra={
+                    "order_id": order_data.get('orderid'),
+                    "sendgrid_api_key_set": bool(sendgrid_api_key),
+                    "sender_email_set": bool(sender_email),
+                    "admin_email_set": bool(admin_email),
+                })
                 return False
             
-            print(f"✅ SendGrid credentials found")
-            print(f"   SENDGRID_API_KEY: {sendgrid_api_key[:20]}...")
-            print(f"   SENDER_EMAIL: {sender_email}")
-            print(f"   ADMIN_EMAIL (Receiver): {admin_email}")
-            
-            # Calculate total items
-            items_list = ""
-            try:
-                items = json.loads(order_data.get('items', '[]'))
-                for item in items:
-                    items_list += f"<li>{item.get('name')} ({item.get('weight')}) x {item.get('quantity')} = ₹{item.get('unitPrice') * item.get('quantity')}</li>"
-            except:
-                items_list = f"<li>{order_data.get('items')}</li>"
-            
-            # HTML email template
-            html = f"""
-            <html>
-                <head>
-                    <style>
-                        body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-                        .container {{ max-width: 600px; margin: 0 auto; background: #f9f9f9; padding: 20px; border-radius: 8px; }}
-                        .header {{ background: #d32f2f; color: white; padding: 20px; border-radius: 8px 8px 0 0; text-align: center; }}
-                        .header h2 {{ margin: 0; }}
-                        .content {{ background: white; padding: 20px; }}
-                        .section {{ margin-bottom: 20px; padding-bottom: 20px; border-bottom: 1px solid #eee; }}
-                        .section h3 {{ color: #d32f2f; margin-top: 0; }}
-                        .info-row {{ display: flex; justify-content: space-between; margin: 8px 0; }}
-                        .label {{ font-weight: bold; color: #666; }}
-                        .value {{ text-align: right; }}
-                        .items-list {{ list-style: none; padding: 0; }}
-                        .items-list li {{ padding: 8px; background: #f5f5f5; margin: 5px 0; border-radius: 4px; }}
-                        .total {{ font-size: 1.3em; font-weight: bold; color: #d32f2f; text-align: right; padding: 15px 0; }}
-                        .status {{ display: inline-block; padding: 8px 12px; background: #fff3e0; color: #e65100; border-radius: 4px; font-weight: bold; }}
-                        .footer {{ text-align: center; color: #999; font-size: 0.9em; margin-top: 20px; border-top: 1px solid #eee; padding-top: 20px; }}
-                    </style>
-                </head>
-                <body>
-                    <div class="container">
-                        <div class="header">
-                            <h2>📦 New Order Received!</h2>
-                        </div>
-                        
-                        <div class="content">
-                            <div class="section">
-                                <h3>Order Information</h3>
-                                <div class="info-row">
-                                    <span class="label">Order ID:</span>
-                                    <span class="value"><strong>{order_data['orderid']}</strong></span>
-                                </div>
-                                <div class="info-row">
-                                    <span class="label">Date & Time:</span>
-                                    <span class="value">{datetime.now().strftime('%d-%m-%Y %H:%M:%S')}</span>
-                                </div>
-                                <div class="info-row">
-                                    <span class="label">Status:</span>
-                                    <span class="value"><span class="status">PENDING</span></span>
-                                </div>
-                            </div>
-                            
-                            <div class="section">
-                                <h3>Customer Information</h3>
-                                <div class="info-row">
-                                    <span class="label">Name:</span>
-                                    <span class="value">{order_data.get('firstName')} {order_data.get('lastName')}</span>
-                                </div>
-                                <div class="info-row">
-                                    <span class="label">Email:</span>
-                                    <span class="value">{order_data.get('email', 'N/A')}</span>
-                                </div>
-                                <div class="info-row">
-                                    <span class="label">Phone:</span>
-                                    <span class="value">{order_data.get('phoneNo')}</span>
-                                </div>
-                                <div class="info-row">
-                                    <span class="label">City:</span>
-                                    <span class="value">{order_data.get('city')}</span>
-                                </div>
-                            </div>
-                            
-                            <div class="section">
-                                <h3>Delivery Address</h3>
-                                <div style="background: #f5f5f5; padding: 12px; border-radius: 4px;">
-                                    <p style="margin: 0;">{order_data.get('address')}</p>
-                                    <p style="margin: 8px 0 0 0;"><strong>{order_data.get('city')} - {order_data.get('pincode')}</strong></p>
-                                </div>
-                            </div>
-                            
-                            <div class="section">
-                                <h3>Order Items</h3>
-                                <ul class="items-list">
-                                    {items_list}
-                                </ul>
-                            </div>
-                            
-                            <div class="section">
-                                <h3>Order Summary</h3>
-                                <div class="info-row">
-                                    <span class="label">Subtotal:</span>
-                                    <span class="value">₹{order_data.get('total', 0)}</span>
-                                </div>
-                                <div class="info-row">
-                                    <span class="label">Delivery Type:</span>
-                                    <span class="value">{order_data.get('deliveryType', 'Standard')}</span>
-                                </div>
-                                <div class="info-row">
-                                    <span class="label">Payment Method:</span>
-                                    <span class="value">{order_data.get('paymentMethod', 'N/A')}</span>
-                                </div>
-                                {f'<div class="info-row"><span class="label">Promo Code:</span><span class="value">{order_data.get("promocode")}</span></div>' if order_data.get('promocode') else ''}
-                                <div class="total">
-                                    Total Amount: ₹{order_data.get('total', 0)}
-                                </div>
-                            </div>
-                            
-                            <div class="footer">
-                                <p>This is an automated email from AMCMart Admin Panel.</p>
-                                <p>© 2025 AMCMart. All rights reserved.</p>
-                            </div>
-                        </div>
-                    </div>
-                </body>
-            </html>
-            """
+            html = render_order_email(order_data)
             
             # Create SendGrid client
             sg = SendGridAPIClient(sendgrid_api_key)
             
             # Send email FROM sender_email TO admin_email
-            print(f"📤 Sending email...")
-            print(f"   FROM: {sender_email}")
-            print(f"   TO: {admin_email}")
+            message = Mail(
+                from_email=(sender_email, "AMCMart Orders"),
+                to_emails=admin_email,
+                subject=f"🎉 New Order - {order_data['orderid']}",
+                html_content=html
+            )
+            response = sg.send(message)
+            email_logger.info("Order email sent", extra={
+                "order_id": order_data['orderid'],
+                "status_code": response.status_code,
+                "sample": True,
+            })
+            return True
+        
+        except Exception:
+            email_logger.exception("Failed to send order email", extra={"order_id": order_data.get('orderid')})
+            return False
+    
+    @staticmethod
+    def send_digest_notification(orders):
+        """Send one summary email to admin for a list of (received_at, order_data)"""
+        order_ids = [order_data.get('orderid') for _, order_data in orders]
+        try:
+            sendgrid_api_key = os.getenv('SENDGRID_API_KEY')
+            sender_email = os.getenv('SENDER_EMAIL')
+            admin_email = os.getenv('ADMIN_EMAIL')
             
-            try:
-                message = Mail(
-                    from_email=(sender_email, "AMCMart Orders"),
-                    to_emails=admin_email,
-                    subject=f"🎉 New Order - {order_data['orderid']}",
-                    html_content=html
-                )
-                response = sg.send(message)
-                print(f"✅ Email sent successfully")
-                print(f"   Status Code: {response.status_code}")
-                print(f"   Order ID: {order_data['orderid']}")
-                print(f"{'='*60}")
-                print(f"✅ EMAIL SENT SUCCESSFULLY")
-                print(f"{'='*60}\n")
-                return True
+            if not sendgrid_api_key or not sender_email or not admin_email:
+                email_logger.warning("SendGrid not configured, skipping digest email", extra={"order_ids": order_ids})
+                return False
             
-            except Exception as e:
-                print(f"❌ Failed to send email: {e}")
-                raise
+            sg = SendGridAPIClient(sendgrid_api_key)
+            message = Mail(
+                from_email=(sender_email, "AMCMart Orders"),
+                to_emails=admin_email,
+                subject=f"🎉 {len(orders)} New Orders - {order_ids[0]} to {order_ids[-1]}",
+                html_content=render_digest_email(orders)
+            )
+            response = sg.send(message)
+            email_logger.info("Digest email sent", extra={
+                "orders": len(orders),
+                "status_code": response.status_code,
+            })
+            return True
         
-        except Exception as e:
-            print(f"\n{'='*60}")
-            print(f"❌ EMAIL SERVICE ERROR")
-            print(f"{'='*60}")
-            print(f"Error: {e}")
-            import traceback
-            traceback.print_exc()
-            print(f"{'='*60}\n")
+        except Exception:
+            email_logger.exception("Failed to send digest email", extra={"order_ids": order_ids})
             return False
 
+class OrderEmailDispatcher:
+    """Send order emails one at a time, or as digests while the order rate is high
+    
+    Once EMAIL_DIGEST_THRESHOLD orders arrive within a minute, further orders
+    are collected for EMAIL_DIGEST_WINDOW_SECONDS and sent as one email.
+    Pre-forked workers forward orders to the supervisor's dispatcher, so the
+    rate and the digests cover all workers.
+    """
+    
+    def __init__(self, window_seconds, threshold):
+        self.window = window_seconds
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        self.arrivals = deque()
+        self.pending = []   # (received_at, order_data)
+        self.timer = None
+        self.digests_sent = 0
+        self.forward = None
+    
+    def forward_to(self, relay):
+        """Hand orders to another process's dispatcher; call in a freshly forked worker"""
+        # The lock may have been held by another thread at fork time
+        self.lock = threading.Lock()
+        self.arrivals.clear()
+        self.pending = []
+        self.timer = None
+        self.forward = relay
+    
+    def notify(self, order_data):
+        """Queue the admin notification for a newly created order"""
+        if self.forward is not None:
+            self.forward.put((request_id_var.get(), order_data))
+            return
+        
+        now = time.monotonic()
+        with self.lock:
+            self.arrivals.append(now)
+            while now - self.arrivals[0] > 60:
+                self.arrivals.popleft()
+            
+            if self.threshold and (self.timer or len(self.arrivals) >= self.threshold):
+                self.pending.append((datetime.now(), order_data))
+                if not self.timer:
+                    self.timer = threading.Timer(self.window, self.flush)
+                    self.timer.name = 'order-email'
+                    self.timer.daemon = True
+                    self.timer.start()
+                return
+        
+        # Run in a copy of this request's context to keep its correlation id
+        email_thread = threading.Thread(
+            target=contextvars.copy_context().run,
+            args=(EmailService.send_order_notification, order_data),
+            name='order-email'
+        )
+        email_thread.daemon = True
+        email_thread.start()
+    
+    def flush(self):
+        """Send whatever the current digest holds"""
+        with self.lock:
+            timer, self.timer = self.timer, None
+            orders, self.pending = self.pending, []
+        if timer:
+            timer.cancel()
+        
+        if len(orders) == 1:
+            EmailService.send_order_notification(orders[0][1])
+        elif orders:
+            EmailService.send_digest_notification(orders)
+            self.digests_sent += 1
+    
+    def relay(self, source):
+        """Dispatch orders forwarded by workers until a None arrives"""
+        while True:
+            message = source.get()
+            if message is None:
+                return
+            request_id, order_data = message
+            request_id_var.set(request_id)
+            self.notify(order_data)
+    
+    def metrics(self):
+        if self.forward is not None:
+            return {"forwarded_to_supervisor": True, "threshold_per_minute": self.threshold}
+        with self.lock:
+            return {
+                "digest_active": self.timer is not None,
+                "pending": len(self.pending),
+                "orders_last_minute": len(self.arrivals),
+                "digests_sent": self.digests_sent,
+                "threshold_per_minute": self.threshold,
+                "window_seconds": self.window,
+            }
+
+email_dispatcher = OrderEmailDispatcher(EMAIL_DIGEST_WINDOW_SECONDS, EMAIL_DIGEST_THRESHOLD)
+atexit.register(email_dispatcher.flush)
+
+class CursorStream:
+    """Rows of a server-side cursor, fetched in batches while iterating
+
+    Closing the stream (or leaving its with block) ends the read transaction and
+    returns the connection to the pool.
+    """
+
+    def __init__(self, database, conn, cursor):
+        self.database = database
+        self.conn = conn
+        self.cursor = cursor
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        if self.conn is None:
+            return
+        try:
+            self.cursor.close()
+            self.conn.rollback()
+        except Exception as e:
+            db_logger.warning("Cursor stream cleanup error", extra={"error": str(e)})
+        finally:
+            self.database.release_connection(self.conn)
+            self.conn = None
+
 class DatabaseManager:
     def __init__(self):
         self.lock = threading.Lock()
+        self.pool = None
+        self.pool_pid = None
+        self.pool_slots = None
         self.init_database()
     
+    def get_pool(self):
+        """Connection pool for this process, created on first use after start or fork"""
+        if self.pool_pid != os.getpid():
+            with self.lock:
+                if self.pool_pid != os.getpid():
+                    # A pool inherited across fork shares sockets with the parent;
+                    # it must never be used or closed here, only replaced
+                    self.pool = psycopg2.pool.ThreadedConnectionPool(DB_POOL_SIZE, DB_POOL_SIZE, DATABASE_URL)
+                    self.pool_slots = threading.BoundedSemaphore(DB_POOL_SIZE)
+                    self.pool_pid = os.getpid()
+        return self.pool
+    
+    def close_pool(self):
+        """Close every pooled connection (call before forking workers)"""
+        with self.lock:
+            if self.pool and self.pool_pid == os.getpid():
+                self.pool.closeall()
+            self.pool = None
+            self.pool_pid = None
+    
     def get_connection(self):
-        """Get database connection"""
+        """Get a pooled database connection, waiting up to DB_POOL_TIMEOUT_SECONDS for one"""
         try:
-            conn = psycopg2.connect(DATABASE_URL)
+            pool = self.get_pool()
+            if not self.pool_slots.acquire(timeout=DB_POOL_TIMEOUT_SECONDS):
+                db_logger.error("Timed out waiting for a pooled connection")
+                return None
+            try:
+                conn = pool.getconn()
+            except Exception:
+                self.pool_slots.release()
+                raise
             return conn
         except Exception as e:
-            print(f"❌ Connection error: {e}")
+            db_logger.error("Connection error", extra={"error": str(e)})
             return None
+    
+    def release_connection(self, conn):
+        """Return a connection to the pool (broken connections are discarded)"""
+        try:
+            self.pool.putconn(conn, close=bool(conn.closed))
+        except Exception as e:
+            db_logger.error("Connection release error", extra={"error": str(e)})
+        finally:
+            self.pool_slots.release()
 
     def init_database(self):
         """Initialize database and create tables"""
+        conn = None
         try:
-            print("\n🔍 Testing database connection...")
             conn = self.get_connection()
             if not conn:
-                print("❌ FATAL: Cannot connect to database!")
-                print(f"   DATABASE_URL: {DATABASE_URL[:80] if DATABASE_URL else 'NOT SET'}")
+                db_logger.critical("Cannot connect to database", extra={
+                    "database_url": DATABASE_URL[:80] if DATABASE_URL else 'NOT SET'
+                })
                 return False
             
-            print("✅ Database connection successful")
-            
             cursor = conn.cursor()
             
             # Test query
             cursor.execute("SELECT 1")
             test_result = cursor.fetchone()
-            print(f"✅ Database test query returned: {test_result}")
+            db_logger.info("Database connection successful", extra={"test_result": test_result})
             
             # Products table
             cursor.execute('''
@@ -261,33 +728,14 @@ class DatabaseManager:
                     price_1kg INTEGER,
                     price_500gm INTEGER,
                     stock_status VARCHAR(50) DEFAULT 'in-stock',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP NOT NULL DEFAULT clock_timestamp()
                 )
             ''')
-            print("✅ Products table created/verified")
             
-            # Orders table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS orders (
-                    id SERIAL PRIMARY KEY,
-                    orderid VARCHAR(50) UNIQUE NOT NULL,
-                    firstName VARCHAR(100),
-                    lastName VARCHAR(100),
-                    phoneNo VARCHAR(20),
-                    email VARCHAR(100),
-                    address TEXT,
-                    city VARCHAR(100),
-                    pincode VARCHAR(10),
-                    deliveryType VARCHAR(50),
-                    paymentMethod VARCHAR(50),
-                    items TEXT,
-                    total INTEGER,
-                    promocode VARCHAR(50),
-                    status VARCHAR(50) DEFAULT 'pending',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            print("✅ Orders table created/verified")
+            # Orders table (partitioned by month)
+            self.init_orders_table(cursor)
+            self.init_order_ids(cursor)
             
             # Promo codes table
             cursor.execute('''
@@ -296,10 +744,10 @@ class DatabaseManager:
                     code VARCHAR(50) UNIQUE NOT NULL,
                     discount INTEGER,
                     status VARCHAR(50) DEFAULT 'active',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP NOT NULL DEFAULT clock_timestamp()
                 )
             ''')
-            print("✅ Promo codes table created/verified")
             
             # Customers table
             cursor.execute('''
@@ -313,122 +761,1563 @@ class DatabaseManager:
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             ''')
-            print("✅ Customers table created/verified")
+            
+            # Idempotency keys for order retries (the orders table is partitioned,
+            # so uniqueness of keys is enforced here rather than on orders)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS idempotency_keys (
+                    idempotency_key VARCHAR(255) PRIMARY KEY,
+                    request_hash VARCHAR(64) NOT NULL,
+                    status_code INTEGER,
+                    response TEXT,
+                    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    claimed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Delivery zones, their slots, and bookings per slot and day
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS delivery_zones (
+                    id SERIAL PRIMARY KEY,
+                    name VARCHAR(100) NOT NULL,
+                    pincodes TEXT[] NOT NULL DEFAULT '{}',
+                    min_order_value INTEGER NOT NULL DEFAULT 0,
+                    max_days_ahead INTEGER NOT NULL DEFAULT 2,
+                    cutoff_minutes INTEGER NOT NULL DEFAULT 60,
+                    status VARCHAR(50) DEFAULT 'active',
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS delivery_slots (
+                    id SERIAL PRIMARY KEY,
+                    zone_id INTEGER NOT NULL REFERENCES delivery_zones (id) ON DELETE CASCADE,
+                    start_time TIME NOT NULL,
+                    end_time TIME NOT NULL,
+                    capacity INTEGER NOT NULL CHECK (capacity >= 0),
+                    UNIQUE (zone_id, start_time)
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS delivery_slot_bookings (
+                    slot_id INTEGER NOT NULL REFERENCES delivery_slots (id) ON DELETE CASCADE,
+                    delivery_date DATE NOT NULL,
+                    booked INTEGER NOT NULL DEFAULT 0,
+                    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (slot_id, delivery_date)
+                )
+            ''')
+            cursor.execute('ALTER TABLE orders ADD COLUMN IF NOT EXISTS delivery_date DATE')
+            cursor.execute('ALTER TABLE orders ADD COLUMN IF NOT EXISTS delivery_slot VARCHAR(20)')
+            
+            self.init_change_tracking(cursor)
+            self.init_snapshot_notify(cursor)
+            self.init_order_rollups(cursor)
+            
+            # Customer lookup by phone and by name/phone prefix
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_phoneno ON orders (phoneNo)')
+            cursor.execute(f'''
+                CREATE INDEX IF NOT EXISTS idx_orders_phone_normalized
+                ON orders ({NORMALIZED_PHONE_SQL} text_pattern_ops, created_at)
+            ''')
+            cursor.execute(f'''
+                CREATE INDEX IF NOT EXISTS idx_orders_customer_name
+                ON orders ({CUSTOMER_NAME_SQL} text_pattern_ops)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_orders_lastname
+                ON orders (lower(lastName) text_pattern_ops)
+            ''')
             
             conn.commit()
             cursor.close()
-            conn.close()
             
-            print(f"✅ Database initialized successfully\n")
+            db_logger.info("Database initialized")
             return True
         
-        except Exception as e:
-            print(f"❌ Database initialization error: {e}")
-            import traceback
-            traceback.print_exc()
+        except Exception:
+            db_logger.exception("Database initialization error")
             return False
+        
+        finally:
+            if conn:
+                self.release_connection(conn)
+    
+    def create_orders_table(self, cursor):
+        """Create the orders table, range-partitioned by month on created_at"""
+        # Partition keys must be part of every unique constraint, so orderid
+        # uniqueness is enforced by the order_ids table (see init_order_ids)
+        cursor.execute('''
+            CREATE TABLE orders (
+                id SERIAL,
+                orderid VARCHAR(50) NOT NULL,
+                firstName VARCHAR(100),
+                lastName VARCHAR(100),
+                phoneNo VARCHAR(20),
+                email VARCHAR(100),
+                address TEXT,
+                city VARCHAR(100),
+                pincode VARCHAR(10),
+                deliveryType VARCHAR(50),
+                paymentMethod VARCHAR(50),
+                items TEXT,
+                total INTEGER,
+                promocode VARCHAR(50),
+                status VARCHAR(50) DEFAULT 'pending',
+                delivery_date DATE,
+                delivery_slot VARCHAR(20),
+                created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP NOT NULL DEFAULT clock_timestamp(),
+                PRIMARY KEY (id, created_at),
+                UNIQUE (orderid, created_at)
+            ) PARTITION BY RANGE (created_at)
+        ''')
+        cursor.execute('CREATE TABLE IF NOT EXISTS orders_default PARTITION OF orders DEFAULT')
+    
+    def init_orders_table(self, cursor):
+        """Create the partitioned orders table, migrating an unpartitioned one if present"""
+        cursor.execute('''
+            SELECT c.relkind FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = current_schema() AND c.relname = 'orders'
+        ''')
+        row = cursor.fetchone()
+        
+        if row is None:
+            self.create_orders_table(cursor)
+            self.ensure_order_partitions(cursor)
+            return
+        
+        if row[0] == 'p':
+            self.ensure_order_partitions(cursor)
+            return
+        
+        # Legacy unpartitioned table: move its rows into monthly partitions.
+        # Runs inside the init_database transaction, so it is all-or-nothing.
+        db_logger.warning("Migrating orders to a partitioned table")
+        cursor.execute('LOCK TABLE orders IN ACCESS EXCLUSIVE MODE')
+        cursor.execute('ALTER TABLE orders RENAME TO orders_unpartitioned')
+        cursor.execute('''
+            SELECT indexname FROM pg_indexes
+            WHERE schemaname = current_schema() AND tablename = 'orders_unpartitioned'
+        ''')
+        for (index_name,) in cursor.fetchall():
+            cursor.execute(f'ALTER INDEX {index_name} RENAME TO {index_name}_unpartitioned')
+        # Keep the id sequence alive when the legacy table is dropped
+        cursor.execute('ALTER SEQUENCE orders_id_seq OWNED BY NONE')
+        cursor.execute('ALTER SEQUENCE orders_id_seq RENAME TO orders_id_seq_unpartitioned')
+        
+        self.create_orders_table(cursor)
+        cursor.execute('SELECT MIN(created_at) FROM orders_unpartitioned')
+        oldest = cursor.fetchone()[0]
+        self.ensure_order_partitions(cursor, oldest.date() if oldest else None)
+        
+        cursor.execute('''
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = 'orders_unpartitioned'
+              AND column_name = 'updated_at'
+        ''')
+        updated_at = 'updated_at' if cursor.fetchone() else 'created_at'
+        cursor.execute(f'''
+            INSERT INTO orders
+                (id, orderid, firstName, lastName, phoneNo, email, address, city, pincode,
+                 deliveryType, paymentMethod, items, total, promocode, status, created_at, updated_at)
+            SELECT id, orderid, firstName, lastName, phoneNo, email, address, city, pincode,
+                   deliveryType, paymentMethod, items, total, promocode, status,
+                   COALESCE(created_at, CURRENT_TIMESTAMP), COALESCE({updated_at}, created_at, CURRENT_TIMESTAMP)
+            FROM orders_unpartitioned
+        ''')
+        migrated = cursor.rowcount
+        cursor.execute('''
+            SELECT setval('orders_id_seq', GREATEST(
+                (SELECT last_value FROM orders_id_seq_unpartitioned),
+                (SELECT COALESCE(MAX(id), 1) FROM orders)
+            ))
+        ''')
+        cursor.execute('DROP TABLE orders_unpartitioned')
+        cursor.execute('DROP SEQUENCE orders_id_seq_unpartitioned')
+        db_logger.warning("Migrated orders to monthly partitions", extra={"orders": migrated})
     
+    def init_order_ids(self, cursor):
+        """Keep every orderid globally unique across partitions via the order_ids table"""
+        cursor.execute("SELECT to_regclass('order_ids')")
+        exists = cursor.fetchone()[0] is not None
+        
+        # Ids stay reserved after their partition is archived
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS order_ids (
+                orderid VARCHAR(50) PRIMARY KEY,
+                created_at TIMESTAMP NOT NULL
+            )
+        ''')
+        if not exists:
+            cursor.execute('''
+                INSERT INTO order_ids (orderid, created_at)
+                SELECT orderid, MIN(created_at) FROM orders GROUP BY orderid
+                ON CONFLICT DO NOTHING
+            ''')
+            db_logger.warning("Created order_ids", extra={"orders": cursor.rowcount})
+        
+        # Written in the inserting transaction, so a duplicate orderid fails the insert
+        cursor.execute('''
+            CREATE OR REPLACE FUNCTION reserve_order_id() RETURNS TRIGGER AS $$
+            BEGIN
+                INSERT INTO order_ids (orderid, created_at) VALUES (NEW.orderid, NEW.created_at);
+                RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql
+        ''')
+        cursor.execute('DROP TRIGGER IF EXISTS trg_orders_reserve_id ON orders')
+        cursor.execute('''
+            CREATE TRIGGER trg_orders_reserve_id
+            BEFORE INSERT ON orders
+            FOR EACH ROW EXECUTE FUNCTION reserve_order_id()
+        ''')
+        cursor.execute('DROP TRIGGER IF EXISTS trg_orders_reserve_changed_id ON orders')
+        cursor.execute('''
+            CREATE TRIGGER trg_orders_reserve_changed_id
+            BEFORE UPDATE OF orderid ON orders
+            FOR EACH ROW WHEN (OLD.orderid IS DISTINCT FROM NEW.orderid)
+            EXECUTE FUNCTION reserve_order_id()
+        ''')
+    
+    def ensure_order_partitions(self, cursor, oldest=None):
+        """Create monthly order partitions from oldest (default: this month) to the months ahead"""
+        month = month_start(oldest or date.today())
+        last = month_start(date.today())
+        for _ in range(ORDER_PARTITION_MONTHS_AHEAD):
+            last = next_month(last)
+        
+        while month <= last:
+            cursor.execute(f'''
+                CREATE TABLE IF NOT EXISTS {order_partition_name(month)}
+                PARTITION OF orders FOR VALUES FROM (%s) TO (%s)
+            ''', (month, next_month(month)))
+            month = next_month(month)
+    
+    def run_maintenance(self):
+        """Fold order rollup deltas, and periodically create upcoming order partitions and purge expired idempotency keys"""
+        next_check = 0
+        while True:
+            try:
+                self.fold_order_rollups()
+            except Exception:
+                db_logger.exception("Rollup fold error")
+            
+            if time.monotonic() < next_check:
+                time.sleep(ROLLUP_FOLD_SECONDS)
+                continue
+            next_check = time.monotonic() + ORDER_PARTITION_CHECK_SECONDS
+            
+            conn = self.get_connection()
+            if conn:
+                try:
+                    cursor = conn.cursor()
+                    self.ensure_order_partitions(cursor)
+                    cursor.execute(
+                        'DELETE FROM idempotency_keys WHERE created_at < CURRENT_TIMESTAMP - make_interval(secs => %s)',
+                        (IDEMPOTENCY_TTL_SECONDS,)
+                    )
+                    conn.commit()
+                    cursor.close()
+                except Exception:
+                    db_logger.exception("Maintenance error")
+                finally:
+                    self.release_connection(conn)
+            time.sleep(ROLLUP_FOLD_SECONDS)
+    
+    def start_maintenance(self):
+        """Start the background maintenance thread"""
+        thread = threading.Thread(target=self.run_maintenance)
+        thread.daemon = True
+        thread.start()
+    
+    def init_change_tracking(self, cursor):
+        """Add updated_at columns, triggers and indexes used by ?since= delta sync"""
+        cursor.execute('''
+            CREATE OR REPLACE FUNCTION set_updated_at() RETURNS TRIGGER AS $$
+            BEGIN
+                NEW.updated_at = clock_timestamp();
+                RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql
+        ''')
+        
+        for table in ('products', 'orders', 'promocodes'):
+            cursor.execute(
+                '''SELECT 1 FROM information_schema.columns
+                   WHERE table_schema = current_schema() AND table_name = %s AND column_name = %s''',
+                (table, 'updated_at')
+            )
+            if not cursor.fetchone():
+                # Existing table: add the column, backfill, then apply the default
+                cursor.execute(f'ALTER TABLE {table} ADD COLUMN updated_at TIMESTAMP')
+                cursor.execute(f'UPDATE {table} SET updated_at = COALESCE(created_at, clock_timestamp())')
+                cursor.execute(f'ALTER TABLE {table} ALTER COLUMN updated_at SET DEFAULT clock_timestamp()')
+                cursor.execute(f'ALTER TABLE {table} ALTER COLUMN updated_at SET NOT NULL')
+                db_logger.warning("Added updated_at column", extra={"table": table})
+            
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_updated_at ON {table} (updated_at, id)')
+            cursor.execute(f'DROP TRIGGER IF EXISTS trg_{table}_updated_at ON {table}')
+            cursor.execute(f'''
+                CREATE TRIGGER trg_{table}_updated_at
+                BEFORE UPDATE ON {table}
+                FOR EACH ROW EXECUTE FUNCTION set_updated_at()
+            ''')
+    
+    def init_snapshot_notify(self, cursor):
+        """Create triggers that NOTIFY snapshot_changed when a table behind an in-memory snapshot changes"""
+        cursor.execute('''
+            CREATE OR REPLACE FUNCTION notify_snapshot_changed() RETURNS TRIGGER AS $$
+            BEGIN
+                PERFORM pg_notify('snapshot_changed', TG_ARGV[0]);
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        ''')
+        
+        # Statement-level, so a bulk write sends one notification
+        for table, snapshot in (('products', 'pricing'), ('promocodes', 'pricing'),
+                                ('delivery_zones', 'delivery'), ('delivery_slots', 'delivery')):
+            cursor.execute(f'DROP TRIGGER IF EXISTS trg_{table}_snapshot_changed ON {table}')
+            cursor.execute(f'''
+                CREATE TRIGGER trg_{table}_snapshot_changed
+                AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+                FOR EACH STATEMENT EXECUTE FUNCTION notify_snapshot_changed('{snapshot}')
+            ''')
+    
+    def init_order_rollups(self, cursor):
+        """Create the dashboard rollup tables and the triggers that keep them current"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS order_rollups (
+                granularity VARCHAR(10) NOT NULL,
+                dimension VARCHAR(20) NOT NULL,
+                bucket TIMESTAMP NOT NULL,
+                dimension_value VARCHAR(100) NOT NULL,
+                order_count INTEGER NOT NULL DEFAULT 0,
+                revenue BIGINT NOT NULL DEFAULT 0,
+                customer_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (granularity, dimension, bucket, dimension_value)
+            )
+        ''')
+        # Per-phone counts behind customer_count: a customer is added to a bucket
+        # on their first counted order in it and removed when their last one goes
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS order_rollup_customers (
+                granularity VARCHAR(10) NOT NULL,
+                dimension VARCHAR(20) NOT NULL,
+                bucket TIMESTAMP NOT NULL,
+                dimension_value VARCHAR(100) NOT NULL,
+                phone VARCHAR(20) NOT NULL,
+                order_count INTEGER NOT NULL DEFAULT 0,
+                revenue BIGINT NOT NULL DEFAULT 0,
+                PRIMARY KEY (granularity, dimension, bucket, dimension_value, phone)
+            )
+        ''')
+        # Order changes waiting to be folded into the rollups. Checkout only appends
+        # here, so concurrent orders never wait on the shared hour/day rollup rows.
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS order_rollup_deltas (
+                id BIGSERIAL PRIMARY KEY,
+                created_at TIMESTAMP NOT NULL,
+                phone VARCHAR(20),
+                city VARCHAR(100),
+                items TEXT,
+                total INTEGER,
+                delta INTEGER NOT NULL
+            )
+        ''')
+
+        # Rollup rows for one order: the order total under 'all' and its city, and
+        # line totals per product category. Items that are not valid JSON only
+        # lose their category rows.
+        cursor.execute('''
+            CREATE OR REPLACE FUNCTION order_rollup_dimensions(order_city TEXT, order_items TEXT, order_total INTEGER)
+            RETURNS TABLE (dimension TEXT, dimension_value TEXT, revenue BIGINT) AS $$
+            DECLARE
+                line_items JSONB;
+            BEGIN
+                RETURN QUERY VALUES
+                    ('all'::TEXT, ''::TEXT, COALESCE(order_total, 0)::BIGINT),
+                    ('city', left(COALESCE(NULLIF(initcap(btrim(order_city)), ''), 'Unknown'), 100), COALESCE(order_total, 0)::BIGINT);
+                BEGIN
+                    line_items := order_items::JSONB;
+                    IF jsonb_typeof(line_items) = 'array' THEN
+                        RETURN QUERY
+                            SELECT 'category'::TEXT, lines.category, SUM(lines.line_total)::BIGINT
+                            FROM (
+                                SELECT left(COALESCE(NULLIF(item->>'category', ''), by_id.category, by_name.category, 'Uncategorized'), 100) AS category,
+                                       COALESCE((item->>'lineTotal')::NUMERIC,
+                                                (item->>'unitPrice')::NUMERIC * (item->>'quantity')::NUMERIC, 0) AS line_total
+                                FROM jsonb_array_elements(line_items) AS item
+                                LEFT JOIN products by_id
+                                    ON by_id.id = CASE WHEN item->>'productId' ~ '^[0-9]{1,9}$' THEN (item->>'productId')::INTEGER END
+                                LEFT JOIN LATERAL (
+                                    SELECT p.category FROM products p
+                                    WHERE lower(p.productname) = lower(item->>'name')
+                                    ORDER BY p.id LIMIT 1
+                                ) by_name ON by_id.id IS NULL
+                            ) lines
+                            GROUP BY lines.category
+                            ORDER BY lines.category;
+                    END IF;
+                EXCEPTION WHEN others THEN
+                    NULL;
+                END;
+            END;
+            $$ LANGUAGE plpgsql STABLE
+        ''')
+
+        # Queue each counted version of an order: +1 when it appears, -1 when it goes away.
+        # Cancelled orders are not counted.
+        cursor.execute('''
+            CREATE OR REPLACE FUNCTION maintain_order_rollups() RETURNS TRIGGER AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.status IS DISTINCT FROM 'cancelled' THEN
+                    INSERT INTO order_rollup_deltas (created_at, phone, city, items, total, delta)
+                    VALUES (OLD.created_at, OLD.phoneNo, OLD.city, OLD.items, OLD.total, -1);
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.status IS DISTINCT FROM 'cancelled' THEN
+                    INSERT INTO order_rollup_deltas (created_at, phone, city, items, total, delta)
+                    VALUES (NEW.created_at, NEW.phoneNo, NEW.city, NEW.items, NEW.total, 1);
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        ''')
+
+        cursor.execute('DROP TRIGGER IF EXISTS trg_orders_rollup_insert ON orders')
+        cursor.execute('DROP TRIGGER IF EXISTS trg_orders_rollup_update ON orders')
+        cursor.execute('DROP TRIGGER IF EXISTS trg_orders_rollup_delete ON orders')
+        cursor.execute('''
+            CREATE TRIGGER trg_orders_rollup_insert
+            AFTER INSERT ON orders
+            FOR EACH ROW EXECUTE FUNCTION maintain_order_rollups()
+        ''')
+        # Only changes to counted fields (status changes, edits) touch the rollups
+        cursor.execute('''
+            CREATE TRIGGER trg_orders_rollup_update
+            AFTER UPDATE ON orders
+            FOR EACH ROW
+            WHEN (OLD.status IS DISTINCT FROM NEW.status OR OLD.total IS DISTINCT FROM NEW.total
+                  OR OLD.items IS DISTINCT FROM NEW.items OR OLD.city IS DISTINCT FROM NEW.city
+                  OR OLD.phoneNo IS DISTINCT FROM NEW.phoneNo OR OLD.created_at IS DISTINCT FROM NEW.created_at)
+            EXECUTE FUNCTION maintain_order_rollups()
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER trg_orders_rollup_delete
+            AFTER DELETE ON orders
+            FOR EACH ROW EXECUTE FUNCTION maintain_order_rollups()
+        ''')
+
+    def rebuild_order_rollups(self):
+        """Recompute the dashboard rollups from every order (backfill or repair)"""
+        conn = self.get_connection()
+        if not conn:
+            raise Exception("No database connection")
+
+        try:
+            cursor = conn.cursor()
+            # Block order writes until commit so no order is counted twice or missed
+            cursor.execute('LOCK TABLE orders IN SHARE MODE')
+            cursor.execute('TRUNCATE order_rollups, order_rollup_customers, order_rollup_deltas')
+            cursor.execute('''
+                INSERT INTO order_rollup_customers
+                    (granularity, dimension, bucket, dimension_value, phone, order_count, revenue)
+                SELECT periods.period, d.dimension, date_trunc(periods.period, o.created_at), d.dimension_value,
+                       right(regexp_replace(COALESCE(o.phoneNo, ''), '[^0-9]', '', 'g'), 10),
+                       COUNT(*), SUM(d.revenue)
+                FROM orders o
+                CROSS JOIN LATERAL order_rollup_dimensions(o.city, o.items, o.total) d
+                CROSS JOIN (VALUES ('hour'), ('day')) AS periods (period)
+                WHERE o.status IS DISTINCT FROM 'cancelled'
+                GROUP BY 1, 2, 3, 4, 5
+            ''')
+            cursor.execute('''
+                INSERT INTO order_rollups
+                    (granularity, dimension, bucket, dimension_value, order_count, revenue, customer_count)
+                SELECT granularity, dimension, bucket, dimension_value, SUM(order_count), SUM(revenue), COUNT(*)
+                FROM order_rollup_customers
+                GROUP BY 1, 2, 3, 4
+            ''')
+            rollup_rows = cursor.rowcount
+            conn.commit()
+            cursor.close()
+            db_logger.warning("Rebuilt order rollups", extra={"rows": rollup_rows})
+            return rollup_rows
+
+        except Exception:
+            conn.rollback()
+            raise
+
+        finally:
+            self.release_connection(conn)
+
+    def fold_order_rollups(self):
+        """Apply queued order changes to the rollups and return how many were applied"""
+        conn = self.get_connection()
+        if not conn:
+            raise Exception("No database connection")
+
+        try:
+            cursor = conn.cursor()
+            # One folder at a time; dashboard reads are not blocked
+            cursor.execute('LOCK TABLE order_rollups IN EXCLUSIVE MODE')
+            cursor.execute('''
+                CREATE TEMP TABLE rollup_fold (
+                    granularity TEXT, dimension TEXT, bucket TIMESTAMP, dimension_value TEXT,
+                    phone TEXT, order_count INTEGER, revenue BIGINT
+                ) ON COMMIT DROP
+            ''')
+            # Net change per customer and bucket. Deltas from transactions that
+            # commit later are not seen here and wait for the next run.
+            cursor.execute('''
+                WITH moved AS (
+                    DELETE FROM order_rollup_deltas RETURNING *
+                ), folded AS (
+                    INSERT INTO rollup_fold
+                    SELECT periods.period, d.dimension, date_trunc(periods.period, m.created_at), d.dimension_value,
+                           right(regexp_replace(COALESCE(m.phone, ''), '[^0-9]', '', 'g'), 10),
+                           SUM(m.delta), SUM(m.delta * d.revenue)
+                    FROM moved m
+                    CROSS JOIN LATERAL order_rollup_dimensions(m.city, m.items, m.total) d
+                    CROSS JOIN (VALUES ('hour'), ('day')) AS periods (period)
+                    GROUP BY 1, 2, 3, 4, 5
+                )
+                SELECT COUNT(*) FROM moved
+            ''')
+            folded = cursor.fetchone()[0]
+            if folded:
+                # A customer joins a bucket when their count becomes positive and leaves when it drops to zero
+                cursor.execute('''
+                    INSERT INTO order_rollups AS r
+                        (granularity, dimension, bucket, dimension_value, order_count, revenue, customer_count)
+                    SELECT f.granularity, f.dimension, f.bucket, f.dimension_value,
+                           SUM(f.order_count), SUM(f.revenue),
+                           SUM((COALESCE(c.order_count, 0) + f.order_count > 0)::INTEGER
+                               - (COALESCE(c.order_count, 0) > 0)::INTEGER)
+                    FROM rollup_fold f
+                    LEFT JOIN order_rollup_customers c
+                        USING (granularity, dimension, bucket, dimension_value, phone)
+                    GROUP BY 1, 2, 3, 4
+                    ON CONFLICT (granularity, dimension, bucket, dimension_value) DO UPDATE
+                    SET order_count = r.order_count + EXCLUDED.order_count,
+                        revenue = r.revenue + EXCLUDED.revenue,
+                        customer_count = r.customer_count + EXCLUDED.customer_count
+                ''')
+                cursor.execute('''
+                    INSERT INTO order_rollup_customers AS c
+                        (granularity, dimension, bucket, dimension_value, phone, order_count, revenue)
+                    SELECT * FROM rollup_fold
+                    ON CONFLICT (granularity, dimension, bucket, dimension_value, phone) DO UPDATE
+                    SET order_count = c.order_count + EXCLUDED.order_count,
+                        revenue = c.revenue + EXCLUDED.revenue
+                ''')
+                cursor.execute('''
+                    DELETE FROM order_rollup_customers c
+                    USING rollup_fold f
+                    WHERE c.granularity = f.granularity AND c.dimension = f.dimension AND c.bucket = f.bucket
+                      AND c.dimension_value = f.dimension_value AND c.phone = f.phone AND c.order_count <= 0
+                ''')
+            conn.commit()
+            cursor.close()
+            return folded
+
+        except Exception:
+            conn.rollback()
+            raise
+
+        finally:
+            self.release_connection(conn)
+
+    def fetch_changes(self, table, since, conditions=(), params=()):
+        """Fetch rows of table inserted or updated after the since timestamp"""
+        where = ''.join(f' AND {condition}' for condition in conditions)
+        return self.fetch_all(
+            f'''SELECT * FROM {table}
+                WHERE updated_at > %s::timestamp - make_interval(secs => %s){where}
+                ORDER BY updated_at, id''',
+            (since, SYNC_OVERLAP_SECONDS, *params)
+        )
+    
+    def stream(self, query, params=(), itersize=EXPORT_FETCH_SIZE):
+        """Run a query on a server-side cursor and return a CursorStream over its rows
+
+        The connection stays checked out until the stream is closed.
+        """
+        conn = self.get_connection()
+        if not conn:
+            raise Exception("No database connection")
+
+        try:
+            cursor = conn.cursor(name=f'stream_{uuid.uuid4().hex}', cursor_factory=RealDictCursor)
+            cursor.itersize = itersize
+            cursor.execute(query, params)
+        except Exception:
+            conn.rollback()
+            self.release_connection(conn)
+            raise
+        return CursorStream(self, conn, cursor)
+
     def execute_query(self, query, params=()):
-        """Execute query with thread safety"""
+        """Execute query and commit"""
+        conn = self.get_connection()
+        if not conn:
+            db_logger.error("No database connection")
+            return False
+        
         try:
-            with self.lock:
-                conn = self.get_connection()
-                if not conn:
-                    print("❌ No database connection!")
-                    return False
-                
-                cursor = conn.cursor()
-                cursor.execute(query, params)
-                conn.commit()
-                cursor.close()
-                conn.close()
-                return True
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            conn.commit()
+            cursor.close()
+            return True
         
-        except Exception as e:
-            print(f"❌ Query error: {e}")
-            import traceback
-            traceback.print_exc()
+        except Exception:
+            db_logger.exception("Query error")
             return False
+        
+        finally:
+            self.release_connection(conn)
+
+    def execute_and_fetch_one(self, query, params=()):
+        """Execute a write with RETURNING, commit, and return the first row"""
+        conn = self.get_connection()
+        if not conn:
+            db_logger.error("No database connection")
+            return None
+        
+        try:
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            cursor.execute(query, params)
+            result = cursor.fetchone()
+            conn.commit()
+            cursor.close()
+            return dict(result) if result else None
+        
+        except Exception:
+            db_logger.exception("Query error")
+            return None
+        
+        finally:
+            self.release_connection(conn)
 
     def fetch_all(self, query, params=()):
         """Fetch all results"""
+        conn = self.get_connection()
+        if not conn:
+            return []
+        
         try:
-            with self.lock:
-                conn = self.get_connection()
-                if not conn:
-                    return []
-                cursor = conn.cursor(cursor_factory=RealDictCursor)
-                cursor.execute(query, params)
-                results = cursor.fetchall()
-                cursor.close()
-                conn.close()
-                return [dict(row) for row in results]
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            cursor.execute(query, params)
+            results = cursor.fetchall()
+            cursor.close()
+            return [dict(row) for row in results]
         except Exception as e:
-            print(f"❌ Fetch error: {e}")
+            db_logger.error("Fetch error", extra={"error": str(e)})
             return []
+        finally:
+            self.release_connection(conn)
     
     def fetch_one(self, query, params=()):
         """Fetch single result"""
+        conn = self.get_connection()
+        if not conn:
+            return None
+        
         try:
-            with self.lock:
-                conn = self.get_connection()
-                if not conn:
-                    return None
-                cursor = conn.cursor(cursor_factory=RealDictCursor)
-                cursor.execute(query, params)
-                result = cursor.fetchone()
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            cursor.execute(query, params)
+            result = cursor.fetchone()
+            cursor.close()
+            return dict(result) if result else None
+        except Exception as e:
+            db_logger.error("Fetch one error", extra={"error": str(e)})
+            return None
+        finally:
+            self.release_connection(conn)
+
+    def insert_and_get_id(self, query, params=()):
+        """Insert and return the ID"""
+        conn = self.get_connection()
+        if not conn:
+            db_logger.error("No database connection")
+            return None
+        
+        try:
+            cursor = conn.cursor()
+            cursor.execute(query + " RETURNING id", params)
+            result = cursor.fetchone()
+            
+            if result is None:
+                db_logger.error("Insert returned no ID")
                 cursor.close()
-                conn.close()
-                return dict(result) if result else None
+                return None
+            
+            conn.commit()
+            cursor.close()
+            
+            final_id = result[0] if result else None
+            return final_id
+        
+        except Exception:
+            db_logger.exception("Insert error")
+            return None
+        
+        finally:
+            self.release_connection(conn)
+
+class PricingEngine:
+    """Validate and price orders against an in-memory snapshot of products and promo codes"""
+    
+    # Accepted spellings of each pack size, mapped to its price column
+    WEIGHT_PRICE_COLUMNS = {
+        '1kg': 'price_1kg', '1000g': 'price_1kg', '1000gm': 'price_1kg',
+        '500gm': 'price_500gm', '500g': 'price_500gm', '0.5kg': 'price_500gm',
+    }
+    
+    def __init__(self, database):
+        self.db = database
+        self.lock = threading.Lock()
+        self.snapshot = None
+        self.loaded_at = 0
+        # Set by SnapshotListener when another process changes products or promo codes
+        self.stale = False
+    
+    def load(self):
+        """Read products and active promo codes on one connection, raising on database errors"""
+        conn = self.db.get_connection()
+        if not conn:
+            raise Exception("No database connection")
+        
+        try:
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            cursor.execute('SELECT id, productname, category, price_1kg, price_500gm, stock_status FROM products')
+            products = cursor.fetchall()
+            cursor.execute('SELECT code, discount FROM promocodes WHERE status = %s', ('active',))
+            promos = cursor.fetchall()
+            conn.rollback()
+            cursor.close()
+            return products, promos
+        
+        finally:
+            self.db.release_connection(conn)
+    
+    def refresh(self):
+        """Reload products and active promo codes into a new snapshot"""
+        # Cleared before reading, so a change notified during the load triggers another
+        self.stale = False
+        try:
+            products, promos = self.load()
         except Exception as e:
-            print(f"❌ Fetch one error: {e}")
+            # Keep serving the last good snapshot rather than a partial one
+            db_logger.error("Pricing snapshot refresh failed", extra={"error": str(e)})
+            self.loaded_at = time.monotonic()
+            return
+        
+        by_id = {product['id']: product for product in products}
+        by_name = {product['productname'].strip().lower(): product for product in products}
+        promo_discounts = {promo['code']: promo['discount'] or 0 for promo in promos}
+        with self.lock:
+            self.snapshot = (by_id, by_name, promo_discounts)
+            self.loaded_at = time.monotonic()
+        db_logger.info("Pricing snapshot refreshed", extra={"products": len(products), "promocodes": len(promos)})
+    
+    def get_snapshot(self):
+        """Current snapshot, reloading it first if it is stale or older than the TTL"""
+        if self.stale or time.monotonic() - self.loaded_at > PRICING_SNAPSHOT_TTL_SECONDS:
+            self.refresh()
+        return self.snapshot or ({}, {}, {})
+    
+    def find_product(self, item, by_id, by_name):
+        product_id = item.get('productId', item.get('id'))
+        try:
+            if product_id is not None and int(product_id) in by_id:
+                return by_id[int(product_id)]
+        except (TypeError, ValueError):
+            pass
+        return by_name.get(str(item.get('name', '')).strip().lower())
+    
+    def price_order(self, items, promocode=None):
+        """Validate line items and compute the authoritative order total in one pass
+        
+        Raises ValueError describing the first invalid line.
+        """
+        if isinstance(items, str):
+            try:
+                items = json.loads(items)
+            except ValueError:
+                raise ValueError("Invalid items")
+        if not isinstance(items, list) or not items:
+            raise ValueError("Order has no items")
+        
+        by_id, by_name, promo_discounts = self.get_snapshot()
+        priced_items = []
+        subtotal = 0
+        
+        for item in items:
+            if not isinstance(item, dict):
+                raise ValueError("Invalid item")
+            
+            product = self.find_product(item, by_id, by_name)
+            if not product:
+                raise ValueError(f"Unknown product: {item.get('name')}")
+            name = product['productname']
+            
+            stock_status = str(product.get('stock_status') or '').lower().replace('_', '-').replace(' ', '-')
+            if stock_status == 'out-of-stock':
+                raise ValueError(f"{name} is out of stock")
+            
+            weight = str(item.get('weight', '')).lower().replace(' ', '')
+            price_column = self.WEIGHT_PRICE_COLUMNS.get(weight)
+            unit_price = product.get(price_column) if price_column else None
+            if unit_price is None:
+                raise ValueError(f"{name} is not available in {item.get('weight')}")
+            
+            quantity = item.get('quantity')
+            if isinstance(quantity, bool) or not isinstance(quantity, int) or not 1 <= quantity <= MAX_ITEM_QUANTITY:
+                raise ValueError(f"Invalid quantity for {name}")
+            
+            line_total = unit_price * quantity
+            subtotal += line_total
+            priced_items.append({
+                "productId": product['id'],
+                "name": name,
+                "weight": '1kg' if price_column == 'price_1kg' else '500gm',
+                "quantity": quantity,
+                "unitPrice": unit_price,
+                "lineTotal": line_total,
+            })
+        
+        discount = 0
+        if promocode:
+            if promocode not in promo_discounts:
+                raise ValueError("Invalid promo code")
+            discount = min(promo_discounts[promocode], subtotal)
+        
+        return {
+            "items": priced_items,
+            "subtotal": subtotal,
+            "discount": discount,
+            "total": subtotal - discount,
+            "promocode": promocode or '',
+        }
+
+class IdempotencyError(Exception):
+    """Raised when an Idempotency-Key cannot be used for this request"""
+    
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+class IdempotencyStore:
+    """Remember responses by Idempotency-Key so client retries replay instead of re-running
+    
+    Completed responses live in a bounded LRU for fast replays and in the
+    idempotency_keys table, whose primary key also serializes concurrent
+    retries across threads and worker processes.
+    """
+    
+    def __init__(self, database):
+        self.db = database
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()  # key -> (request_hash, status_code, response, expires_at)
+    
+    def remember(self, key, request_hash, status_code, response, created_at=None):
+        expires_at = (created_at or time.time()) + IDEMPOTENCY_TTL_SECONDS
+        with self.lock:
+            self.cache[key] = (request_hash, status_code, response, expires_at)
+            self.cache.move_to_end(key)
+            while len(self.cache) > IDEMPOTENCY_CACHE_SIZE:
+                self.cache.popitem(last=False)
+    
+    def cached(self, key):
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry is None:
+                return None
+            if entry[3] < time.time():
+                del self.cache[key]
+                return None
+            self.cache.move_to_end(key)
+            return entry
+    
+    def begin(self, key, request_hash):
+        """Claim key for this request, or return (status_code, response) to replay
+        
+        Returns None when the caller should process the request.
+        """
+        if len(key) > 255:
+            raise IdempotencyError("Idempotency-Key is too long", 400)
+        
+        entry = self.cached(key)
+        if entry:
+            if entry[0] != request_hash:
+                raise IdempotencyError("Idempotency-Key was used with a different request", 422)
+            return entry[1], entry[2]
+        
+        # Insert the key, or take over an expired one or an abandoned claim
+        claimed = self.db.execute_and_fetch_one('''
+            INSERT INTO idempotency_keys (idempotency_key, request_hash) VALUES (%s, %s)
+            ON CONFLICT (idempotency_key) DO UPDATE
+                SET request_hash = EXCLUDED.request_hash, status_code = NULL, response = NULL,
+                    created_at = CURRENT_TIMESTAMP, claimed_at = CURRENT_TIMESTAMP
+                WHERE idempotency_keys.created_at < CURRENT_TIMESTAMP - make_interval(secs => %s)
+                   OR (idempotency_keys.response IS NULL
+                       AND idempotency_keys.claimed_at < CURRENT_TIMESTAMP - make_interval(secs => %s))
+            RETURNING idempotency_key
+        ''', (key, request_hash, IDEMPOTENCY_TTL_SECONDS, IDEMPOTENCY_LEASE_SECONDS))
+        if claimed:
+            return None
+        
+        row = self.db.fetch_one(
+            '''SELECT request_hash, status_code, response, EXTRACT(EPOCH FROM created_at) AS created_epoch
+               FROM idempotency_keys WHERE idempotency_key = %s''',
+            (key,)
+        )
+        if row is None:
+            raise IdempotencyError("Could not reserve Idempotency-Key", 503)
+        if row['request_hash'] != request_hash:
+            raise IdempotencyError("Idempotency-Key was used with a different request", 422)
+        if row['response'] is None:
+            raise IdempotencyError("A request with this Idempotency-Key is still in progress", 409)
+        
+        self.remember(key, request_hash, row['status_code'], row['response'], float(row['created_epoch']))
+        return row['status_code'], row['response']
+    
+    def complete(self, key, request_hash, status_code, response):
+        """Store the response for replays, returning False if it could not be written"""
+        # This process replays from its cache even if the database write fails
+        self.remember(key, request_hash, status_code, response)
+        return self.db.execute_query(
+            'UPDATE idempotency_keys SET status_code = %s, response = %s WHERE idempotency_key = %s',
+            (status_code, response, key)
+        )
+    
+    def release(self, key):
+        """Forget a claimed key whose request failed, so the client can retry it"""
+        self.db.execute_query(
+            'DELETE FROM idempotency_keys WHERE idempotency_key = %s AND response IS NULL',
+            (key,)
+        )
+
+class PendingWrite:
+    """One statement waiting for the group-commit writer"""
+    
+    def __init__(self, query, params):
+        self.query = query
+        self.params = params
+        self.queued_at = time.monotonic()
+        self.done = threading.Event()
+        self.success = False
+
+class GroupCommitWriter:
+    """Write concurrent statements in shared transactions, one savepoint per statement
+    
+    Each statement is isolated by a savepoint, so one failing order does not
+    roll back the others in its batch. With group commit disabled, writes go
+    straight to execute_query.
+    """
+    
+    def __init__(self, database, enabled, max_wait_ms, max_batch):
+        self.db = database
+        self.enabled = enabled
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.writer_pid = None
+        self.stats = {
+            "batches": 0,
+            "rows": 0,
+            "failed_rows": 0,
+            "failed_batches": 0,
+            "largest_batch": 0,
+            "queue_wait_ms": 0.0,
+            "commit_ms": 0.0,
+        }
+    
+    def ensure_writer(self):
+        # The writer thread belongs to one process; start a new one after fork
+        if self.writer_pid != os.getpid():
+            with self.lock:
+                if self.writer_pid != os.getpid():
+                    self.queue = queue.Queue()
+                    thread = threading.Thread(target=self.run, name='group-commit')
+                    thread.daemon = True
+                    thread.start()
+                    self.writer_pid = os.getpid()
+    
+    def submit(self, query, params=()):
+        """Execute query in the next group commit and wait for its result"""
+        if not self.enabled:
+            return self.db.execute_query(query, params)
+        
+        self.ensure_writer()
+        pending = PendingWrite(query, params)
+        self.queue.put(pending)
+        pending.done.wait()
+        return pending.success
+    
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                try:
+                    remaining = deadline - time.monotonic()
+                    if remaining > 0:
+                        batch.append(self.queue.get(timeout=remaining))
+                    else:
+                        batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self.write_batch(batch)
+    
+    def write_batch(self, batch):
+        started = time.monotonic()
+        conn = self.db.get_connection()
+        committed = False
+        
+        try:
+            if not conn:
+                db_logger.error("No database connection for group commit", extra={"rows": len(batch)})
+                return
+            
+            cursor = conn.cursor()
+            for pending in batch:
+                cursor.execute('SAVEPOINT group_write')
+                try:
+                    cursor.execute(pending.query, pending.params)
+                    cursor.execute('RELEASE SAVEPOINT group_write')
+                    pending.success = True
+                except psycopg2.Error:
+                    db_logger.exception("Group commit row error")
+                    cursor.execute('ROLLBACK TO SAVEPOINT group_write')
+            conn.commit()
+            cursor.close()
+            committed = True
+        
+        except Exception:
+            db_logger.exception("Group commit error", extra={"rows": len(batch)})
+        
+        finally:
+            if conn:
+                self.db.release_connection(conn)
+            finished = time.monotonic()
+            with self.lock:
+                self.stats["batches"] += 1
+                self.stats["rows"] += len(batch)
+                self.stats["largest_batch"] = max(self.stats["largest_batch"], len(batch))
+                self.stats["commit_ms"] += (finished - started) * 1000
+                if not committed:
+                    self.stats["failed_batches"] += 1
+                for pending in batch:
+                    self.stats["queue_wait_ms"] += (started - pending.queued_at) * 1000
+                    if not committed:
+                        pending.success = False
+                    if not pending.success:
+                        self.stats["failed_rows"] += 1
+            for pending in batch:
+                pending.done.set()
+    
+    def metrics(self):
+        with self.lock:
+            stats = dict(self.stats)
+        batches = stats["batches"] or 1
+        rows = stats["rows"] or 1
+        return {
+            "enabled": self.enabled,
+            "max_wait_ms": self.max_wait * 1000,
+            "max_batch": self.max_batch,
+            "pending": self.queue.qsize(),
+            "batches": stats["batches"],
+            "rows": stats["rows"],
+            "failed_rows": stats["failed_rows"],
+            "failed_batches": stats["failed_batches"],
+            "largest_batch": stats["largest_batch"],
+            "avg_batch_size": round(stats["rows"] / batches, 2),
+            "avg_queue_wait_ms": round(stats["queue_wait_ms"] / rows, 3),
+            "avg_commit_ms": round(stats["commit_ms"] / batches, 3),
+        }
+
+class DeliveryEngine:
+    """Pincode serviceability and delivery slot capacity, served from memory
+
+    Zones and their slots are a snapshot refreshed like the pricing snapshot. In
+    a single process, bookings are counted in memory under a lock and written to
+    delivery_slot_bookings in the background. With several worker processes
+    (shared=True) the counters cannot be shared, so each booking is claimed with
+    one conditional upsert instead.
+    """
+
+    def __init__(self, database, shared=False):
+        self.db = database
+        self.shared = shared
+        self.lock = threading.Lock()
+        # Held while writing or reloading bookings, so a reload never misses
+        # changes that are being written
+        self.flush_lock = threading.Lock()
+        self.zones_by_pincode = None
+        self.booked = {}
+        self.pending = {}
+        self.loaded_at = 0
+        # Set by SnapshotListener when another process changes zones or slots
+        self.stale = False
+        self.flusher_pid = None
+
+    def load(self):
+        """Read zones, slots and upcoming bookings, raising on database errors"""
+        conn = self.db.get_connection()
+        if not conn:
+            raise Exception("No database connection")
+
+        try:
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            cursor.execute('''
+                SELECT id, name, pincodes, min_order_value, max_days_ahead, cutoff_minutes
+                FROM delivery_zones WHERE status = 'active' ORDER BY id
+            ''')
+            zones = [dict(row) for row in cursor.fetchall()]
+            cursor.execute('SELECT id, zone_id, start_time, end_time, capacity FROM delivery_slots ORDER BY start_time, id')
+            slots = [dict(row) for row in cursor.fetchall()]
+            cursor.execute(
+                'SELECT slot_id, delivery_date, booked FROM delivery_slot_bookings WHERE delivery_date >= %s',
+                (self.local_now().date(),)
+            )
+            bookings = cursor.fetchall()
+            conn.rollback()
+            cursor.close()
+            return zones, slots, bookings
+
+        finally:
+            self.db.release_connection(conn)
+
+    def refresh(self):
+        """Write pending bookings, then reload zones, slots and booking counts"""
+        with self.flush_lock:
+            self.write_pending()
+            self.stale = False
+            try:
+                zones, slots, bookings = self.load()
+            except Exception as e:
+                # Keep serving the last good snapshot; counts must never be reset by a failed read
+                db_logger.error("Delivery snapshot refresh failed", extra={"error": str(e)})
+                self.loaded_at = time.monotonic()
+                return
+
+            slots_by_zone = {}
+            for slot in slots:
+                slot['label'] = f"{slot['start_time']:%H:%M}-{slot['end_time']:%H:%M}"
+                slots_by_zone.setdefault(slot['zone_id'], []).append(slot)
+            zones_by_pincode = {}
+            for zone in zones:
+                zone['slots'] = slots_by_zone.get(zone['id'], [])
+                for pincode in zone['pincodes'] or []:
+                    # A pincode listed in several zones belongs to the oldest one
+                    zones_by_pincode.setdefault(pincode.strip(), zone)
+
+            with self.lock:
+                booked = {(row['slot_id'], row['delivery_date']): row['booked'] for row in bookings}
+                for key, change in self.pending.items():
+                    booked[key] = booked.get(key, 0) + change
+                self.booked = booked
+                self.zones_by_pincode = zones_by_pincode
+                self.loaded_at = time.monotonic()
+        db_logger.info("Delivery snapshot refreshed", extra={"zones": len(zones), "slots": len(slots)})
+
+    def write_pending(self):
+        """Write booking changes counted since the last write (call with flush_lock held)"""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        changes = [(key, change) for key, change in pending.items() if change]
+        if not changes:
+            return
+
+        written = self.db.execute_query('''
+            INSERT INTO delivery_slot_bookings AS b (slot_id, delivery_date, booked)
+            SELECT * FROM unnest(%s::INTEGER[], %s::DATE[], %s::INTEGER[])
+            ON CONFLICT (slot_id, delivery_date) DO UPDATE
+            SET booked = GREATEST(b.booked + EXCLUDED.booked, 0), updated_at = CURRENT_TIMESTAMP
+        ''', (
+            [slot_id for (slot_id, _), _ in changes],
+            [day for (_, day), _ in changes],
+            [change for _, change in changes],
+        ))
+        if not written:
+            # Put the changes back for the next attempt
+            with self.lock:
+                for key, change in changes:
+                    self.pending[key] = self.pending.get(key, 0) + change
+
+    def flush(self):
+        """Write pending booking changes now"""
+        with self.flush_lock:
+            self.write_pending()
+
+    def ensure_flusher(self):
+        # The flush thread belongs to one process; start a new one after fork
+        if self.flusher_pid != os.getpid():
+            with self.lock:
+                if self.flusher_pid != os.getpid():
+                    thread = threading.Thread(target=self.run, name='delivery-flush')
+                    thread.daemon = True
+                    thread.start()
+                    self.flusher_pid = os.getpid()
+
+    def run(self):
+        while True:
+            time.sleep(DELIVERY_FLUSH_SECONDS)
+            try:
+                self.flush()
+            except Exception:
+                db_logger.exception("Delivery booking flush error")
+
+    def get_zones(self):
+        """Pincode to zone map, reloading it first if it is stale or older than the TTL"""
+        if self.zones_by_pincode is None or self.stale or time.monotonic() - self.loaded_at > DELIVERY_SNAPSHOT_TTL_SECONDS:
+            self.refresh()
+        return self.zones_by_pincode or {}
+
+    def find_zone(self, pincode):
+        return self.get_zones().get(str(pincode or '').strip())
+
+    def slot_status(self, zone, slot, day, now):
+        """Free places in a slot on day, and why it cannot be booked (None if it can)"""
+        with self.lock:
+            available = max(slot['capacity'] - self.booked.get((slot['id'], day), 0), 0)
+        closes_at = datetime.combine(day, slot['start_time']) - timedelta(minutes=zone['cutoff_minutes'])
+        if now >= closes_at:
+            return available, "Booking for this slot has closed"
+        if not available:
+            return available, "Delivery slot is full"
+        return available, None
+
+    @staticmethod
+    def local_now():
+        """Current time in DELIVERY_TIMEZONE, naive like the slot times it is compared with"""
+        return datetime.now(DELIVERY_TIMEZONE).replace(tzinfo=None)
+
+    def available_slots(self, zone, day=None):
+        """Slots with availability for day, or for every bookable day if day is None"""
+        now = self.local_now()
+        today = now.date()
+        days = [day] if day else [today + timedelta(days=offset) for offset in range(zone['max_days_ahead'] + 1)]
+        schedule = []
+        for current in days:
+            slots = []
+            for slot in zone['slots']:
+                available, reason = self.slot_status(zone, slot, current, now)
+                slots.append({
+                    "id": slot['id'],
+                    "label": slot['label'],
+                    "capacity": slot['capacity'],
+                    "available": available,
+                    "bookable": reason is None,
+                })
+            schedule.append({"date": current.isoformat(), "slots": slots})
+        return schedule
+
+    def book_order(self, pincode, subtotal, delivery_date=None, delivery_slot=None):
+        """Check serviceability and book a delivery slot for an order
+
+        Returns (slot_id, day, label) when a slot was booked, or None. Raises
+        ValueError if the order cannot be delivered as requested. Without any
+        delivery zones configured, every order is accepted.
+        """
+        zones = self.get_zones()
+        if not zones:
             return None
+        zone = zones.get(str(pincode or '').strip())
+        if not zone:
+            raise ValueError(f"Sorry, we do not deliver to pincode {pincode}")
+        if subtotal < zone['min_order_value']:
+            raise ValueError(f"Minimum order value for your area is ₹{zone['min_order_value']}")
 
-    def insert_and_get_id(self, query, params=()):
-        """Insert and return the ID"""
+        if not delivery_date and not delivery_slot:
+            if DELIVERY_SLOT_REQUIRED:
+                raise ValueError("Choose a delivery date and slot")
+            return None
         try:
+            day = date.fromisoformat(str(delivery_date))
+        except ValueError:
+            raise ValueError("Invalid delivery date, use YYYY-MM-DD")
+        slot = next((slot for slot in zone['slots']
+                     if str(delivery_slot) in (slot['label'], str(slot['id']))), None)
+        if not slot:
+            raise ValueError("Invalid delivery slot")
+
+        now = self.local_now()
+        if not now.date() <= day <= now.date() + timedelta(days=zone['max_days_ahead']):
+            raise ValueError(f"Delivery date must be within the next {zone['max_days_ahead']} days")
+        _, reason = self.slot_status(zone, slot, day, now)
+        if reason:
+            raise ValueError(reason)
+
+        self.reserve(slot, day)
+        return slot['id'], day, slot['label']
+
+    def reserve(self, slot, day):
+        """Take one place in slot on day, raising ValueError if it is full"""
+        key = (slot['id'], day)
+        if self.shared:
+            row = self.db.execute_and_fetch_one('''
+                INSERT INTO delivery_slot_bookings AS b (slot_id, delivery_date, booked)
+                VALUES (%s, %s, 1)
+                ON CONFLICT (slot_id, delivery_date) DO UPDATE
+                SET booked = b.booked + 1, updated_at = CURRENT_TIMESTAMP
+                WHERE b.booked < %s
+                RETURNING b.booked
+            ''', (slot['id'], day, slot['capacity']))
+            if not row:
+                raise ValueError("Delivery slot is full")
             with self.lock:
-                conn = self.get_connection()
-                if not conn:
-                    print("❌ No database connection!")
-                    return None
-                
+                self.booked[key] = row['booked']
+            return
+
+        with self.lock:
+            if self.booked.get(key, 0) >= slot['capacity']:
+                raise ValueError("Delivery slot is full")
+            self.booked[key] = self.booked.get(key, 0) + 1
+            self.pending[key] = self.pending.get(key, 0) + 1
+        self.ensure_flusher()
+
+    def release(self, slot_id, day):
+        """Give back a place taken by reserve (the order was not created)"""
+        key = (slot_id, day)
+        if self.shared:
+            self.db.execute_query('''
+                UPDATE delivery_slot_bookings SET booked = GREATEST(booked - 1, 0), updated_at = CURRENT_TIMESTAMP
+                WHERE slot_id = %s AND delivery_date = %s
+            ''', (slot_id, day))
+        with self.lock:
+            self.booked[key] = max(self.booked.get(key, 0) - 1, 0)
+            if not self.shared:
+                self.pending[key] = self.pending.get(key, 0) - 1
+
+    @staticmethod
+    def parse_zone(data):
+        """Validate a delivery zone payload, raising ValueError on the first problem"""
+        name = str(data.get('name') or '').strip()
+        if not name:
+            raise ValueError("Zone name is required")
+        pincodes = data.get('pincodes') or []
+        if isinstance(pincodes, str):
+            pincodes = pincodes.split(',')
+        pincodes = [str(pincode).strip() for pincode in pincodes if str(pincode).strip()]
+        if not pincodes or not all(re.fullmatch(r'[0-9]{6}', pincode) for pincode in pincodes):
+            raise ValueError("Pincodes must be a list of 6-digit pincodes")
+
+        rules = {}
+        for field, column, default, maximum in (
+            ('minOrderValue', 'min_order_value', 0, None),
+            ('maxDaysAhead', 'max_days_ahead', 2, 30),
+            ('cutoffMinutes', 'cutoff_minutes', 60, 24 * 60),
+        ):
+            value = data.get(field, default)
+            if isinstance(value, bool) or not isinstance(value, int) or value < 0 or (maximum and value > maximum):
+                raise ValueError(f"Invalid {field}")
+            rules[column] = value
+
+        slots = data.get('slots')
+        if not isinstance(slots, list) or not slots:
+            raise ValueError("A zone needs at least one slot")
+        parsed_slots = []
+        for slot in slots:
+            try:
+                start = datetime.strptime(str(slot.get('start')), '%H:%M').time()
+                end = datetime.strptime(str(slot.get('end')), '%H:%M').time()
+            except (AttributeError, ValueError):
+                raise ValueError("Slot times must be HH:MM")
+            capacity = slot.get('capacity')
+            if start >= end or isinstance(capacity, bool) or not isinstance(capacity, int) or capacity < 0:
+                raise ValueError(f"Invalid slot {slot.get('start')}-{slot.get('end')}")
+            parsed_slots.append((start, end, capacity))
+        if len({start for start, _, _ in parsed_slots}) != len(parsed_slots):
+            raise ValueError("Slots must start at different times")
+
+        return name, pincodes, rules, parsed_slots
+
+    def metrics(self):
+        with self.lock:
+            return {
+                "shared": self.shared,
+                "pincodes": len(self.zones_by_pincode or {}),
+                "pending_changes": sum(1 for change in self.pending.values() if change),
+            }
+
+class SnapshotListener:
+    """Marks in-memory snapshots stale when any process changes the tables behind them
+    
+    Triggers send NOTIFY snapshot_changed with the snapshot's name; each process
+    listens on its own connection. Notifications sent while the listener is not
+    connected are lost, so every snapshot is marked stale on each (re)connect.
+    """
+    
+    def __init__(self, engines):
+        self.engines = engines
+    
+    def start(self):
+        """Start the listener thread (call in the process that serves requests)"""
+        thread = threading.Thread(target=self.run, name='snapshot-listen')
+        thread.daemon = True
+        thread.start()
+    
+    def mark_stale(self, names):
+        for name in names:
+            engine = self.engines.get(name)
+            if engine:
+                engine.stale = True
+    
+    def run(self):
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(DATABASE_URL)
+                conn.autocommit = True
                 cursor = conn.cursor()
-                cursor.execute(query + " RETURNING id", params)
-                result = cursor.fetchone()
-                
-                if result is None:
-                    print("❌ Insert returned no ID")
-                    cursor.close()
-                    conn.close()
-                    return None
-                
-                conn.commit()
+                cursor.execute('LISTEN snapshot_changed')
                 cursor.close()
-                conn.close()
-                
-                final_id = result[0] if result else None
-                return final_id
-        
-        except Exception as e:
-            print(f"❌ Insert error: {e}")
-            import traceback
-            traceback.print_exc()
-            return None
+                self.mark_stale(self.engines)
+                while True:
+                    select.select([conn], [], [])
+                    conn.poll()
+                    names = {notify.payload for notify in conn.notifies}
+                    conn.notifies.clear()
+                    self.mark_stale(names)
+            except Exception as e:
+                db_logger.error("Snapshot listener error", extra={"error": str(e)})
+            finally:
+                if conn:
+                    conn.close()
+            time.sleep(SNAPSHOT_LISTEN_RETRY_SECONDS)
 
 # Global database instance
 db = DatabaseManager()
+pricing = PricingEngine(db)
+idempotency = IdempotencyStore(db)
+order_writer = GroupCommitWriter(db, ORDER_GROUP_COMMIT, ORDER_GROUP_COMMIT_MAX_WAIT_MS, ORDER_GROUP_COMMIT_MAX_BATCH)
+export_slots = threading.BoundedSemaphore(EXPORT_MAX_CONCURRENT)
+delivery = DeliveryEngine(db)
+atexit.register(delivery.flush)
+snapshot_listener = SnapshotListener({'pricing': pricing, 'delivery': delivery})
+
+REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+class RequestBodyError(Exception):
+    """A request body that cannot be read; status_code is the HTTP status to return"""
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+class RequestReader:
+    """Wraps a connection's rfile to enforce the slow-client limits
+
+    Every socket read waits at most REQUEST_IDLE_TIMEOUT_SECONDS and never past the
+    request deadline, so trickling bytes cannot hold a handler thread. While
+    header_budget is set, reading more header bytes than it allows raises
+    LineTooLong, which BaseHTTPRequestHandler answers with 431.
+    """
+
+    def __init__(self, rfile, connection, deadline):
+        self.rfile = rfile
+        self.connection = connection
+        self.deadline = deadline
+        self.header_budget = None
+
+    def wait(self, read, *args):
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("Request not received in time")
+        self.connection.settimeout(min(REQUEST_IDLE_TIMEOUT_SECONDS, remaining))
+        try:
+            return read(*args)
+        finally:
+            # Responses are written with the idle timeout only
+            self.connection.settimeout(REQUEST_IDLE_TIMEOUT_SECONDS)
+
+    def readline(self, limit=-1):
+        if self.header_budget is not None and not 0 <= limit <= self.header_budget:
+            limit = self.header_budget + 1
+
+        # Built from peek() so each socket read is checked against the deadline
+        parts, size = [], 0
+        while limit < 0 or size < limit:
+            buffered = self.wait(self.rfile.peek)
+            if not buffered:
+                break
+            newline = buffered.find(b'\n')
+            take = len(buffered) if newline < 0 else newline + 1
+            if limit >= 0:
+                take = min(take, limit - size)
+            parts.append(self.rfile.read(take))
+            size += take
+            if parts[-1].endswith(b'\n'):
+                break
+        line = b''.join(parts)
+
+        if self.header_budget is not None:
+            self.header_budget -= len(line)
+            if self.header_budget < 0:
+                raise http.client.LineTooLong(f"headers longer than {MAX_HEADER_BYTES} bytes")
+        return line
+
+    def read1(self, size=-1):
+        return self.wait(self.rfile.read1, size)
+
+    def close(self):
+        self.rfile.close()
 
 class APIHandler(BaseHTTPRequestHandler):
-    
+    # Socket timeout until the request deadline applies (see RequestReader)
+    timeout = REQUEST_IDLE_TIMEOUT_SECONDS
+
+    def setup(self):
+        super().setup()
+        self.rfile = RequestReader(self.rfile, self.connection, time.monotonic() + REQUEST_READ_TIMEOUT_SECONDS)
+
     def log_message(self, format, *args):
-        """Suppress default logging"""
-        pass
+        """Send access logs to the structured logger at DEBUG"""
+        http_logger.debug(format % args, extra={"client": self.address_string()})
+    
+    def log_error(self, format, *args):
+        http_logger.warning(format % args, extra={"client": self.address_string()})
+    
+    def parse_request(self):
+        """Parse the request line and headers, then assign the request's correlation id"""
+        request_id_var.set(uuid.uuid4().hex[:16])
+        self.rfile.header_budget = MAX_HEADER_BYTES
+        try:
+            if not super().parse_request():
+                return False
+        finally:
+            self.rfile.header_budget = None
+        
+        client_request_id = self.headers.get('X-Request-ID', '')
+        if REQUEST_ID_PATTERN.match(client_request_id):
+            request_id_var.set(client_request_id)
+        return True
+    
+    def end_headers(self):
+        request_id = request_id_var.get()
+        if request_id:
+            self.send_header('X-Request-ID', request_id)
+        super().end_headers()
     
     def _set_cors_headers(self):
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, PUT, DELETE, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Accept')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Accept, X-Request-ID, Idempotency-Key')
+        self.send_header('Access-Control-Expose-Headers', 'X-Request-ID, Content-Disposition, Idempotent-Replayed')
+    
+    def _send_bad_request(self, error):
+        self.send_response(400)
+        self.send_header('Content-Type', 'application/json')
+        self._set_cors_headers()
+        self.end_headers()
+        self.wfile.write(json.dumps({"success": False, "error": error}).encode())
     
     def do_OPTIONS(self):
         self.send_response(200)
@@ -442,7 +2331,9 @@ class APIHandler(BaseHTTPRequestHandler):
         self.end_headers()
     
     def do_GET(self):
-        path = urlparse(self.path).path
+        parsed_url = urlparse(self.path)
+        path = parsed_url.path
+        query = parse_qs(parsed_url.query)
         
         if path == '/' or path == '':
             self.send_response(200)
@@ -457,7 +2348,7 @@ class APIHandler(BaseHTTPRequestHandler):
             test_conn = db.get_connection()
             db_status = "✅ Connected" if test_conn else "❌ Failed"
             if test_conn:
-                test_conn.close()
+                db.release_connection(test_conn)
             
             self.send_response(200)
             self.send_header('Content-Type', 'application/json')
@@ -469,11 +2360,21 @@ class APIHandler(BaseHTTPRequestHandler):
                 "timestamp": datetime.now().isoformat(),
                 "database": db_status,
                 "email_configured": bool(SENDER_EMAIL and ADMIN_EMAIL and SENDGRID_API_KEY),
+                "worker_pid": os.getpid(),
             }
             self.wfile.write(json.dumps(response, default=str).encode())
         
         elif path == '/api/products':
-            products = db.fetch_all('SELECT * FROM products ORDER BY id DESC')
+            try:
+                since = ChangeToken.decode(query.get('since', [None])[0])
+            except ValueError as e:
+                self._send_bad_request(str(e))
+                return
+            
+            if since:
+                products = db.fetch_changes('products', since)
+            else:
+                products = db.fetch_all('SELECT * FROM products ORDER BY id DESC')
             self.send_response(200)
             self.send_header('Content-Type', 'application/json')
             self._set_cors_headers()
@@ -481,12 +2382,26 @@ class APIHandler(BaseHTTPRequestHandler):
             response = {
                 "success": True,
                 "data": products,
-                "count": len(products)
+                "count": len(products),
+                "sync_token": ChangeToken.latest(products, since)
             }
             self.wfile.write(json.dumps(response, default=str).encode())
         
         elif path == '/api/orders':
-            orders = db.fetch_all('SELECT * FROM orders ORDER BY created_at DESC')
+            try:
+                since = ChangeToken.decode(query.get('since', [None])[0])
+                start, end = DateRange.parse(query)
+            except ValueError as e:
+                self._send_bad_request(str(e))
+                return
+            
+            # Date filters on created_at let PostgreSQL prune to the matching partitions
+            conditions, params = DateRange.conditions(start, end)
+            if since:
+                orders = db.fetch_changes('orders', since, conditions, params)
+            else:
+                where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+                orders = db.fetch_all(f'SELECT * FROM orders{where} ORDER BY created_at DESC', tuple(params))
             self.send_response(200)
             self.send_header('Content-Type', 'application/json')
             self._set_cors_headers()
@@ -494,7 +2409,8 @@ class APIHandler(BaseHTTPRequestHandler):
             response = {
                 "success": True,
                 "data": orders,
-                "count": len(orders)
+                "count": len(orders),
+                "sync_token": ChangeToken.latest(orders, since)
             }
             self.wfile.write(json.dumps(response, default=str).encode())
         
@@ -513,6 +2429,223 @@ class APIHandler(BaseHTTPRequestHandler):
             }
             self.wfile.write(json.dumps(response, default=str).encode())
         
+        elif path == '/api/customers/search':
+            search = query.get('q', [''])[0].strip()
+            try:
+                limit, offset = Pagination.parse(query)
+                if len(search) < 2:
+                    raise ValueError("Search needs at least 2 characters")
+            except ValueError as e:
+                self._send_bad_request(str(e))
+                return
+            
+            # Digits (with optional +91, spaces, dashes) search phones, anything else names
+            if re.fullmatch(r'[0-9+\s()-]+', search) and len(re.sub(r'[^0-9]', '', search)) >= 3:
+                digits = re.sub(r'[^0-9]', '', search.removeprefix('+91'))
+                condition = f'{NORMALIZED_PHONE_SQL} LIKE %s'
+                params = (like_prefix(digits.lstrip('0')[-10:]),)
+            else:
+                name = like_prefix(search.lower())
+                condition = f'({CUSTOMER_NAME_SQL} LIKE %s OR lower(lastName) LIKE %s)'
+                params = (name, name)
+            
+            rows = db.fetch_all(f'''
+                SELECT {NORMALIZED_PHONE_SQL} AS phone,
+                       (array_agg(firstName ORDER BY created_at DESC))[1] AS firstname,
+                       (array_agg(lastName ORDER BY created_at DESC))[1] AS lastname,
+                       (array_agg(email ORDER BY created_at DESC))[1] AS email,
+                       (array_agg(city ORDER BY created_at DESC))[1] AS city,
+                       COUNT(*) AS order_count,
+                       COALESCE(SUM(total), 0) AS total_spent,
+                       MAX(created_at) AS last_order_at
+                FROM orders
+                WHERE {condition}
+                GROUP BY 1
+                ORDER BY last_order_at DESC
+                LIMIT %s OFFSET %s
+            ''', (*params, limit + 1, offset))
+            customers, pagination = Pagination.page(rows, limit, offset)
+            
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self._set_cors_headers()
+            self.end_headers()
+            response = {
+                "success": True,
+                "data": customers,
+                "count": len(customers),
+                "pagination": pagination
+            }
+            self.wfile.write(json.dumps(response, default=str).encode())
+        
+        elif path.startswith('/api/customers/') and path.endswith('/orders'):
+            phone = normalize_phone(unquote(path[len('/api/customers/'):-len('/orders')]))
+            try:
+                limit, offset = Pagination.parse(query)
+                start, end = DateRange.parse(query)
+                if len(phone) < 6:
+                    raise ValueError("Invalid phone number")
+            except ValueError as e:
+                self._send_bad_request(str(e))
+                return
+            
+            conditions, params = DateRange.conditions(start, end)
+            where = ''.join(f' AND {condition}' for condition in conditions)
+            rows = db.fetch_all(f'''
+                SELECT * FROM orders
+                WHERE {NORMALIZED_PHONE_SQL} = %s{where}
+                ORDER BY created_at DESC, id DESC
+                LIMIT %s OFFSET %s
+            ''', (phone, *params, limit + 1, offset))
+            orders, pagination = Pagination.page(rows, limit, offset)
+            
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self._set_cors_headers()
+            self.end_headers()
+            response = {
+                "success": True,
+                "data": orders,
+                "count": len(orders),
+                "phone": phone,
+                "pagination": pagination
+            }
+            self.wfile.write(json.dumps(response, default=str).encode())
+        
+        elif path == '/api/export/orders':
+            export_format = query.get('format', ['csv'])[0].lower()
+            statuses = [status.strip() for value in query.get('status', []) for status in value.split(',') if status.strip()]
+            try:
+                start, end = DateRange.parse(query)
+                if export_format not in ('csv', 'ndjson'):
+                    raise ValueError("Invalid format, use csv or ndjson")
+            except ValueError as e:
+                self._send_bad_request(str(e))
+                return
+
+            if not export_slots.acquire(blocking=False):
+                self.send_response(503)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Retry-After', '30')
+                self._set_cors_headers()
+                self.end_headers()
+                self.wfile.write(json.dumps({"success": False, "error": "Too many exports running, try again shortly"}).encode())
+                return
+
+            try:
+                conditions, params = DateRange.conditions(start, end)
+                if statuses:
+                    conditions.append('status = ANY(%s)')
+                    params.append(statuses)
+                where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+                try:
+                    rows = db.stream(f'SELECT * FROM orders{where} ORDER BY created_at, id', tuple(params))
+                except Exception as e:
+                    db_logger.error("Export query failed", extra={"error": str(e)})
+                    self.send_response(500)
+                    self.send_header('Content-Type', 'application/json')
+                    self._set_cors_headers()
+                    self.end_headers()
+                    self.wfile.write(json.dumps({"success": False, "error": "Export failed"}).encode())
+                    return
+
+                # HTTP/1.1 clients get a chunked body; HTTP/1.0 clients read until close
+                chunked = self.request_version == 'HTTP/1.1'
+                accepted = [part.split(';')[0].strip() for part in self.headers.get('Accept-Encoding', '').split(',')]
+                compress = 'gzip' in accepted
+                extension = 'csv' if export_format == 'csv' else 'ndjson'
+                filename = f"orders-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{extension}"
+
+                with rows:
+                    if chunked:
+                        self.protocol_version = 'HTTP/1.1'
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/csv; charset=utf-8' if export_format == 'csv' else 'application/x-ndjson')
+                    self.send_header('Content-Disposition', f'attachment; filename="{filename}"')
+                    if chunked:
+                        self.send_header('Transfer-Encoding', 'chunked')
+                    if compress:
+                        self.send_header('Content-Encoding', 'gzip')
+                    self.send_header('Vary', 'Accept-Encoding')
+                    self.send_header('Connection', 'close')
+                    self._set_cors_headers()
+                    self.end_headers()
+
+                    stream = ResponseStream(self.wfile, chunked, compress)
+                    order_count = line_count = 0
+                    try:
+                        if export_format == 'csv':
+                            writer = csv.DictWriter(stream, fieldnames=EXPORT_ORDER_COLUMNS + EXPORT_LINE_COLUMNS)
+                            writer.writeheader()
+                        for order in rows:
+                            order_count += 1
+                            for line in order_lines(order):
+                                line_count += 1
+                                if export_format == 'csv':
+                                    writer.writerow(csv_safe(line))
+                                else:
+                                    stream.write(json.dumps(line, default=str) + '\n')
+                        stream.close()
+                        http_logger.info("Orders exported", extra={
+                            "format": export_format, "orders": order_count, "lines": line_count,
+                        })
+                    except (BrokenPipeError, ConnectionResetError):
+                        http_logger.info("Export client disconnected", extra={"orders": order_count})
+                    except Exception:
+                        # Headers are gone; closing without the final chunk marks the body as truncated
+                        http_logger.exception("Export failed", extra={"orders": order_count})
+            finally:
+                export_slots.release()
+
+        elif path == '/api/delivery/slots':
+            pincode = query.get('pincode', [''])[0].strip()
+            try:
+                if not pincode:
+                    raise ValueError("pincode is required")
+                try:
+                    day = date.fromisoformat(query['date'][0]) if query.get('date') else None
+                except ValueError:
+                    raise ValueError("Invalid date, use YYYY-MM-DD")
+            except ValueError as e:
+                self._send_bad_request(str(e))
+                return
+            
+            zones = delivery.get_zones()
+            zone = zones.get(pincode)
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self._set_cors_headers()
+            self.end_headers()
+            response = {
+                "success": True,
+                "data": {
+                    "pincode": pincode,
+                    # Without any zones configured every pincode is accepted
+                    "serviceable": bool(zone) or not zones,
+                    "zone": zone['name'] if zone else None,
+                    "min_order_value": zone['min_order_value'] if zone else 0,
+                    "days": delivery.available_slots(zone, day) if zone else []
+                }
+            }
+            self.wfile.write(json.dumps(response, default=str).encode())
+        
+        elif path == '/api/metrics':
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self._set_cors_headers()
+            self.end_headers()
+            response = {
+                "success": True,
+                "data": {
+                    "worker_pid": os.getpid(),
+                    "group_commit": order_writer.metrics(),
+                    "email": email_dispatcher.metrics(),
+                    "delivery": delivery.metrics(),
+                    "dropped_log_records": DroppingQueueHandler.dropped,
+                }
+            }
+            self.wfile.write(json.dumps(response, default=str).encode())
+        
         elif path == '/api/dashboard/stats':
             self.send_response(200)
             self.send_header('Content-Type', 'application/json')
@@ -536,18 +2669,105 @@ class APIHandler(BaseHTTPRequestHandler):
             }
             self.wfile.write(json.dumps(response, default=str).encode())
         
+        elif path == '/api/dashboard/timeseries':
+            granularity = query.get('granularity', ['day'])[0]
+            dimension = query.get('dimension', ['all'])[0]
+            try:
+                if granularity not in ROLLUP_GRANULARITIES:
+                    raise ValueError(f"Invalid granularity, use {' or '.join(ROLLUP_GRANULARITIES)}")
+                if dimension not in ROLLUP_DIMENSIONS:
+                    raise ValueError(f"Invalid dimension, use {', '.join(ROLLUP_DIMENSIONS)}")
+                start, end = DateRange.parse(query)
+                step = ROLLUP_GRANULARITIES[granularity]
+                if not start:
+                    start = (end or datetime.now()) - step * TIMESERIES_DEFAULT_BUCKETS[granularity]
+                if ((end or datetime.now()) - start) / step > TIMESERIES_MAX_BUCKETS:
+                    raise ValueError(f"Date range too long, at most {TIMESERIES_MAX_BUCKETS} {granularity} buckets")
+            except ValueError as e:
+                self._send_bad_request(str(e))
+                return
+
+            # Reads only rollup rows in the range, however many orders they cover
+            series = db.fetch_all('''
+                SELECT bucket, dimension_value AS value, order_count AS orders, revenue, customer_count AS customers
+                FROM order_rollups
+                WHERE granularity = %s AND dimension = %s
+                  AND bucket >= date_trunc(%s, %s::timestamp) AND bucket < COALESCE(%s, 'infinity'::timestamp)
+                  AND order_count > 0
+                ORDER BY bucket, revenue DESC, value
+            ''', (granularity, dimension, granularity, start, end))
+            if dimension == 'all':
+                for point in series:
+                    del point['value']
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self._set_cors_headers()
+            self.end_headers()
+            response = {
+                "success": True,
+                "data": {
+                    "granularity": granularity,
+                    "dimension": dimension,
+                    "from": start,
+                    "to": end,
+                    "series": series
+                },
+                "count": len(series)
+            }
+            self.wfile.write(json.dumps(response, default=str).encode())
+
         else:
             self.send_response(404)
             self.send_header('Content-Type', 'application/json')
             self._set_cors_headers()
             self.end_headers()
             self.wfile.write(json.dumps({"success": False, "error": "Endpoint not found"}).encode())
-    
+
+    def _read_body(self):
+        """Read and decode the request body in chunks, enforcing MAX_BODY_BYTES"""
+        if 'Transfer-Encoding' in self.headers:
+            raise RequestBodyError("Chunked request bodies are not supported, send Content-Length", 411)
+        try:
+            content_length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            raise RequestBodyError("Invalid Content-Length", 400)
+        if content_length < 0:
+            raise RequestBodyError("Invalid Content-Length", 400)
+        # Refuse before reading, so a large Content-Length never allocates anything
+        if content_length > MAX_BODY_BYTES:
+            raise RequestBodyError(f"Request body too large, limit is {MAX_BODY_BYTES} bytes", 413)
+
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        parts, received = [], 0
+        try:
+            while received < content_length:
+                chunk = self.rfile.read1(min(64 * 1024, content_length - received))
+                if not chunk:
+                    raise RequestBodyError("Request body shorter than Content-Length", 400)
+                received += len(chunk)
+                parts.append(decoder.decode(chunk))
+            parts.append(decoder.decode(b'', final=True))
+        except UnicodeDecodeError:
+            raise RequestBodyError("Request body is not valid UTF-8", 400)
+        except TimeoutError:
+            raise RequestBodyError("Request body not received in time", 408)
+        return ''.join(parts)
+
     def do_POST(self):
         path = urlparse(self.path).path
-        content_length = int(self.headers.get('Content-Length', 0))
-        body = self.rfile.read(content_length).decode('utf-8')
-        
+        try:
+            body = self._read_body()
+        except RequestBodyError as e:
+            # The rest of the body is never read, so the connection cannot be reused
+            self.send_response(e.status_code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Connection', 'close')
+            self._set_cors_headers()
+            self.end_headers()
+            self.wfile.write(json.dumps({"success": False, "error": str(e)}).encode())
+            return
+
         try:
             data = json.loads(body) if body else {}
         except json.JSONDecodeError as e:
@@ -575,6 +2795,7 @@ class APIHandler(BaseHTTPRequestHandler):
                 )
                 
                 if product_id:
+                    pricing.refresh()
                     self.send_response(201)
                     self.send_header('Content-Type', 'application/json')
                     self._set_cors_headers()
@@ -586,7 +2807,7 @@ class APIHandler(BaseHTTPRequestHandler):
                             "message": f"Product {productname} created successfully!"
                         }
                     }
-                    print(f"✅ Product created: {productname} (ID: {product_id})")
+                    http_logger.info("Product created", extra={"product_id": product_id, "sample": True})
                     self.wfile.write(json.dumps(response).encode())
                 else:
                     raise Exception("Failed to insert product")
@@ -599,10 +2820,51 @@ class APIHandler(BaseHTTPRequestHandler):
                 self.wfile.write(json.dumps({"success": False, "error": str(e)}).encode())
         
         elif path == '/api/orders':
+            idempotency_key = self.headers.get('Idempotency-Key')
+            request_hash = hashlib.sha256(body.encode()).hexdigest()
+            
+            if idempotency_key:
+                try:
+                    replay = idempotency.begin(idempotency_key, request_hash)
+                except IdempotencyError as e:
+                    self.send_response(e.status_code)
+                    self.send_header('Content-Type', 'application/json')
+                    self._set_cors_headers()
+                    self.end_headers()
+                    self.wfile.write(json.dumps({"success": False, "error": str(e)}).encode())
+                    return
+                
+                if replay:
+                    status_code, response_body = replay
+                    self.send_response(status_code)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Idempotent-Replayed', 'true')
+                    self._set_cors_headers()
+                    self.end_headers()
+                    self.wfile.write(response_body.encode())
+                    return
+            
+            reservation = None
             try:
-                order_id = f"AMC{uuid.uuid4().hex[:8].upper()}"
+                # Validate items against current prices/stock before touching the database
+                priced = pricing.price_order(data.get('items'), data.get('promocode'))
+                if data.get('total') is not None and data.get('total') != priced['total']:
+                    http_logger.info("Client total differs from computed total", extra={
+                        "client_total": data.get('total'),
+                        "total": priced['total'],
+                    })
+                items_json = json.dumps(priced['items'])
+                
+                # Serviceability and slot capacity are checked in memory; a booked
+                # slot is given back if the order is not created
+                reservation = delivery.book_order(
+                    data.get('pincode'), priced['subtotal'], data.get('deliveryDate'), data.get('deliverySlot')
+                )
+                delivery_date, delivery_slot = reservation[1:] if reservation else (None, None)
                 
-                # Build params tuple - EXACTLY 14 values for 14 columns
+                order_id = f"AMC{uuid.uuid4().hex[:12].upper()}"
+                
+                # Build params tuple - EXACTLY 16 values for 16 columns
                 params = (
                     order_id,                               # 1. orderid
                     data.get('firstName'),                  # 2. firstName
@@ -614,30 +2876,35 @@ class APIHandler(BaseHTTPRequestHandler):
                     data.get('pincode'),                    # 8. pincode
                     data.get('deliveryType'),               # 9. deliveryType
                     data.get('paymentMethod'),              # 10. paymentMethod
-                    data.get('items'),                      # 11. items
-                    data.get('total'),                      # 12. total
-                    data.get('promocode', ''),              # 13. promocode
+                    items_json,                             # 11. items
+                    priced['total'],                        # 12. total
+                    priced['promocode'],                    # 13. promocode
                     'pending',                              # 14. status
+                    delivery_date,                          # 15. delivery_date
+                    delivery_slot,                          # 16. delivery_slot
                 )
                 
                 query = '''INSERT INTO orders 
                     (orderid, firstName, lastName, phoneNo, email, address, city, pincode, 
-                     deliveryType, paymentMethod, items, total, promocode, status)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)'''
+                     deliveryType, paymentMethod, items, total, promocode, status,
+                     delivery_date, delivery_slot)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)'''
                 
-                success = db.execute_query(query, params)
+                success = order_writer.submit(query, params)
                 
                 if success:
+                    # The booking now belongs to the order
+                    reservation = None
+                    
                     # Send email notification
                     email_data = data.copy()
                     email_data['orderid'] = order_id
-                    
-                    email_thread = threading.Thread(
-                        target=EmailService.send_order_notification,
-                        args=(email_data,)
-                    )
-                    email_thread.daemon = True
-                    email_thread.start()
+                    email_data['items'] = items_json
+                    email_data['subtotal'] = priced['subtotal']
+                    email_data['discount'] = priced['discount']
+                    email_data['total'] = priced['total']
+                    email_data['promocode'] = priced['promocode']
+                    email_dispatcher.notify(email_data)
                     
                     self.send_response(201)
                     self.send_header('Content-Type', 'application/json')
@@ -648,15 +2915,30 @@ class APIHandler(BaseHTTPRequestHandler):
                         "data": {
                             "order_id": order_id,
                             "message": "Order placed successfully!",
-                            "customer_name": f"{data.get('firstName')} {data.get('lastName')}"
+                            "customer_name": f"{data.get('firstName')} {data.get('lastName')}",
+                            "subtotal": priced['subtotal'],
+                            "discount": priced['discount'],
+                            "total": priced['total'],
+                            "delivery_date": delivery_date.isoformat() if delivery_date else None,
+                            "delivery_slot": delivery_slot
                         }
                     }
-                    print(f"✅ Order created: {order_id}")
-                    self.wfile.write(json.dumps(response).encode())
+                    http_logger.info("Order created", extra={"order_id": order_id, "sample": True})
+                    response_body = json.dumps(response)
+                    if idempotency_key and not idempotency.complete(idempotency_key, request_hash, 201, response_body):
+                        http_logger.error("Could not store idempotent response", extra={
+                            "order_id": order_id,
+                            "idempotency_key": idempotency_key,
+                        })
+                    self.wfile.write(response_body.encode())
                 else:
                     raise Exception("Failed to create order")
             
             except Exception as e:
+                if reservation:
+                    delivery.release(reservation[0], reservation[1])
+                if idempotency_key:
+                    idempotency.release(idempotency_key)
                 self.send_response(400)
                 self.send_header('Content-Type', 'application/json')
                 self._set_cors_headers()
@@ -671,6 +2953,7 @@ class APIHandler(BaseHTTPRequestHandler):
                 )
                 
                 if product_id:
+                    pricing.refresh()
                     self.send_response(201)
                     self.send_header('Content-Type', 'application/json')
                     self._set_cors_headers()
@@ -679,7 +2962,7 @@ class APIHandler(BaseHTTPRequestHandler):
                         "success": True,
                         "data": {"message": "Promo code created successfully!"}
                     }
-                    print(f"✅ Promo code created: {data.get('code')}")
+                    http_logger.info("Promo code created", extra={"code": data.get('code'), "sample": True})
                     self.wfile.write(json.dumps(response).encode())
                 else:
                     raise Exception("Failed to insert promo code")
@@ -691,6 +2974,50 @@ class APIHandler(BaseHTTPRequestHandler):
                 self.end_headers()
                 self.wfile.write(json.dumps({"success": False, "error": str(e)}).encode())
         
+        elif path == '/api/delivery/zones':
+            try:
+                name, pincodes, rules, slots = DeliveryEngine.parse_zone(data)
+                zone = db.execute_and_fetch_one('''
+                    WITH zone AS (
+                        INSERT INTO delivery_zones (name, pincodes, min_order_value, max_days_ahead, cutoff_minutes)
+                        VALUES (%s, %s, %s, %s, %s)
+                        RETURNING id
+                    ), slots AS (
+                        INSERT INTO delivery_slots (zone_id, start_time, end_time, capacity)
+                        SELECT zone.id, s.start_time, s.end_time, s.capacity
+                        FROM zone, unnest(%s::TIME[], %s::TIME[], %s::INTEGER[]) AS s (start_time, end_time, capacity)
+                    )
+                    SELECT id FROM zone
+                ''', (
+                    name, pincodes, rules['min_order_value'], rules['max_days_ahead'], rules['cutoff_minutes'],
+                    [start for start, _, _ in slots], [end for _, end, _ in slots], [capacity for _, _, capacity in slots],
+                ))
+                
+                if zone:
+                    delivery.refresh()
+                    self.send_response(201)
+                    self.send_header('Content-Type', 'application/json')
+                    self._set_cors_headers()
+                    self.end_headers()
+                    response = {
+                        "success": True,
+                        "data": {
+                            "id": zone['id'],
+                            "message": f"Delivery zone {name} created successfully!"
+                        }
+                    }
+                    http_logger.info("Delivery zone created", extra={"zone_id": zone['id'], "sample": True})
+                    self.wfile.write(json.dumps(response).encode())
+                else:
+                    raise Exception("Failed to insert delivery zone")
+            
+            except Exception as e:
+                self.send_response(400)
+                self.send_header('Content-Type', 'application/json')
+                self._set_cors_headers()
+                self.end_headers()
+                self.wfile.write(json.dumps({"success": False, "error": str(e)}).encode())
+        
         elif path == '/api/promo/validate':
             try:
                 code = data.get('code')
@@ -726,10 +3053,6 @@ class APIHandler(BaseHTTPRequestHandler):
         
         elif path == '/api/test-sendgrid':
             try:
-                print(f"\n{'='*60}")
-                print(f"🧪 TESTING SENDGRID CONNECTION")
-                print(f"{'='*60}")
-                
                 sendgrid_api_key = os.getenv('SENDGRID_API_KEY')
                 sender_email = os.getenv('SENDER_EMAIL')
                 admin_email = os.getenv('ADMIN_EMAIL')
@@ -741,10 +3064,6 @@ class APIHandler(BaseHTTPRequestHandler):
                 if not admin_email:
                     raise Exception("ADMIN_EMAIL not set in environment")
                 
-                print(f"✅ API Key found: {sendgrid_api_key[:20]}...")
-                print(f"✅ Sender Email: {sender_email}")
-                print(f"✅ Admin Email: {admin_email}")
-                
                 # Create simple test message
                 message = Mail(
                     from_email=(sender_email, "AMCMart Test"),
@@ -753,13 +3072,10 @@ class APIHandler(BaseHTTPRequestHandler):
                     html_content="<h1>✅ SendGrid is working!</h1><p>This is a test email from AMCMart API.</p>"
                 )
                 
-                print(f"📤 Sending test email...")
                 sg = SendGridAPIClient(sendgrid_api_key)
                 response = sg.send(message)
                 
-                print(f"✅ Test email sent!")
-                print(f"   Status Code: {response.status_code}")
-                print(f"{'='*60}\n")
+                email_logger.info("SendGrid test email sent", extra={"status_code": response.status_code})
                 
                 self.send_response(200)
                 self.send_header('Content-Type', 'application/json')
@@ -775,9 +3091,7 @@ class APIHandler(BaseHTTPRequestHandler):
                 }).encode())
             
             except Exception as e:
-                print(f"\n❌ TEST FAILED: {e}")
-                import traceback
-                traceback.print_exc()
+                email_logger.exception("SendGrid test failed")
                 
                 self.send_response(400)
                 self.send_header('Content-Type', 'application/json')
@@ -792,20 +3106,281 @@ class APIHandler(BaseHTTPRequestHandler):
                     "admin_email_set": bool(os.getenv('ADMIN_EMAIL'))
                 }).encode())
 
-def run_server(port=5000):
-    server_address = ('', port)
-    httpd = HTTPServer(server_address, APIHandler)
-    print(f'\n🚀 AMCMart API Server Starting...')
-    print(f'🔧 Port: {port}')
-    print(f'📊 API Base URL: https://amcmart-api.onrender.com/api')
-    print(f'💾 Database: PostgreSQL')
-    print(f'📧 Email Service: SendGrid')
-    print(f'📧 Sender: {SENDER_EMAIL}')
-    print(f'📧 Admin (Receiver): {ADMIN_EMAIL}')
-    print(f'📧 Status: {"✅ Configured" if SENDER_EMAIL and ADMIN_EMAIL and SENDGRID_API_KEY else "⚠️ Not configured"}')
-    print(f'\n✅ Server ready to accept requests\n')
+class APIServer(ThreadingHTTPServer):
+    """Threaded HTTP server that can share its port with sibling worker processes"""
+    
+    # Let in-flight requests finish when the server is shut down
+    daemon_threads = False
+    block_on_close = True
+    # Pending connections the kernel queues before resetting new ones
+    request_queue_size = LISTEN_BACKLOG
+    
+    def __init__(self, server_address, handler_class, reuse_port=False):
+        self.reuse_port = reuse_port
+        self.connection_slots = threading.BoundedSemaphore(MAX_CONNECTIONS) if MAX_CONNECTIONS > 0 else None
+        super().__init__(server_address, handler_class)
+
+    def server_bind(self):
+        if self.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+    def process_request(self, request, client_address):
+        """Start a handler thread, or turn the connection away when MAX_CONNECTIONS are open"""
+        if self.connection_slots and not self.connection_slots.acquire(blocking=False):
+            http_logger.warning("Connection limit reached", extra={"max_connections": MAX_CONNECTIONS})
+            body = json.dumps({"success": False, "error": "Server busy, try again shortly"}).encode()
+            try:
+                request.settimeout(1)
+                request.sendall(
+                    b'HTTP/1.0 503 Service Unavailable\r\nContent-Type: application/json\r\n'
+                    b'Retry-After: 1\r\nConnection: close\r\nContent-Length: %d\r\n\r\n%s' % (len(body), body)
+                )
+            except OSError:
+                pass
+            self.shutdown_request(request)
+            return
+        try:
+            super().process_request(request, client_address)
+        except Exception:
+            if self.connection_slots:
+                self.connection_slots.release()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            if self.connection_slots:
+                self.connection_slots.release()
+
+def wait_for_email_threads(timeout):
+    """Give queued order emails a chance to go out before the process exits"""
+    deadline = time.monotonic() + timeout
+    for thread in threading.enumerate():
+        if thread.name == 'order-email' and thread.is_alive():
+            thread.join(max(0, deadline - time.monotonic()))
+
+def serve_worker(port, slot, ready_fd=None):
+    """Run one pre-forked worker until it receives SIGTERM
+    
+    Writes a byte to ready_fd, if given, once the socket is listening.
+    """
+    httpd = APIServer(('', port), APIHandler, reuse_port=True)
+    
+    def handle_term(signum, frame):
+        # shutdown() blocks until serve_forever() returns, so call it off this thread
+        threading.Thread(target=httpd.shutdown).start()
+    
+    signal.signal(signal.SIGTERM, handle_term)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    
+    if slot == 0:
+        db.start_maintenance()
+    snapshot_listener.start()
+    logger.info("Worker ready", extra={"port": port, "slot": slot, "pid": os.getpid()})
+    if ready_fd is not None:
+        os.write(ready_fd, b'1')
+        os.close(ready_fd)
+    httpd.serve_forever()
+    httpd.server_close()
+    email_dispatcher.flush()
+    wait_for_email_threads(WORKER_GRACEFUL_TIMEOUT_SECONDS)
+    logger.info("Worker stopped", extra={"slot": slot, "pid": os.getpid()})
+
+class PreforkSupervisor:
+    """Fork worker processes sharing one port via SO_REUSEPORT and keep them running
+    
+    SIGHUP restarts workers one at a time; SIGTERM/SIGINT stops them all.
+    """
+    
+    def __init__(self, port, workers):
+        self.port = port
+        self.workers = workers
+        self.children = {}      # pid -> (slot, started_at)
+        self.retiring = set()   # pids we asked to stop
+        self.running = True
+        self.reload_requested = False
+        # Workers send order emails through this pipe to the one dispatcher here
+        self.email_queue = multiprocessing.get_context('fork').SimpleQueue()
+        self.email_relay = None
+    
+    def spawn(self, slot, wait_ready=False):
+        """Fork a worker for slot; with wait_ready, stop it and return None if it does not start listening in time"""
+        ready_read, ready_write = os.pipe() if wait_ready else (None, None)
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 0
+            try:
+                if ready_read is not None:
+                    os.close(ready_read)
+                email_dispatcher.forward_to(self.email_queue)
+                serve_worker(self.port, slot, ready_write)
+            except Exception:
+                logger.exception("Worker crashed", extra={"slot": slot})
+                exit_code = 1
+            finally:
+                stop_logging()
+                os._exit(exit_code)
+        self.children[pid] = (slot, time.monotonic())
+        if not wait_ready:
+            return pid
+        
+        os.close(ready_write)
+        try:
+            readable, _, _ = select.select([ready_read], [], [], WORKER_START_TIMEOUT_SECONDS)
+            # EOF means the worker exited before it was ready
+            if readable and os.read(ready_read, 1):
+                return pid
+        finally:
+            os.close(ready_read)
+        self.retiring.add(pid)
+        os.kill(pid, signal.SIGTERM)
+        return None
+    
+    def handle_stop(self, signum, frame):
+        self.running = False
+    
+    def handle_reload(self, signum, frame):
+        self.reload_requested = True
+    
+    def rolling_restart(self):
+        """Replace workers one at a time: start the new one, then stop and reap the old one"""
+        logger.warning("Restarting workers", extra={"workers": len(self.children)})
+        for pid, (slot, _) in list(self.children.items()):
+            if pid in self.retiring or pid not in self.children:
+                continue
+            if not self.running:
+                return
+            
+            new_pid = self.spawn(slot, wait_ready=True)
+            if new_pid is None:
+                # Leave the old worker serving
+                logger.error("Replacement worker did not start, stopping restart", extra={"slot": slot})
+                return
+            
+            self.retiring.add(pid)
+            os.kill(pid, signal.SIGTERM)
+            self.wait_for_exit(pid)
+        logger.warning("Workers restarted", extra={"workers": len(self.children)})
+    
+    def wait_for_exit(self, pid):
+        """Reap workers until pid has exited, killing it after the graceful timeout"""
+        deadline = time.monotonic() + WORKER_GRACEFUL_TIMEOUT_SECONDS
+        while pid in self.children and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        
+        if pid in self.children:
+            logger.warning("Worker did not stop in time, killing", extra={"pid": pid})
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            self.children.pop(pid, None)
+            self.retiring.discard(pid)
+    
+    def reap(self):
+        """Collect exited workers and replace any that exited unexpectedly"""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            
+            slot, started_at = self.children.pop(pid, (None, 0))
+            if pid in self.retiring:
+                self.retiring.discard(pid)
+                continue
+            if slot is None or not self.running:
+                continue
+            
+            logger.error("Worker exited unexpectedly, restarting", extra={
+                "pid": pid, "slot": slot, "status": status
+            })
+            if time.monotonic() - started_at < WORKER_RESTART_BACKOFF_SECONDS:
+                # Avoid a tight fork loop when workers crash on startup
+                time.sleep(WORKER_RESTART_BACKOFF_SECONDS)
+            self.spawn(slot)
+    
+    def stop(self):
+        """Ask every worker to finish in-flight requests, then kill stragglers"""
+        for pid in self.children:
+            os.kill(pid, signal.SIGTERM)
+        
+        deadline = time.monotonic() + WORKER_GRACEFUL_TIMEOUT_SECONDS
+        while self.children and time.monotonic() < deadline:
+            self.retiring.update(self.children)
+            self.reap()
+            time.sleep(0.1)
+        
+        for pid in self.children:
+            logger.warning("Worker did not stop in time, killing", extra={"pid": pid})
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        
+        # Every worker has exited, so nothing else is forwarded after this
+        self.email_queue.put(None)
+        self.email_relay.join()
+        email_dispatcher.flush()
+        wait_for_email_threads(WORKER_GRACEFUL_TIMEOUT_SECONDS)
+    
+    def run(self):
+        # Pooled connections must not be shared across fork
+        db.close_pool()
+        
+        signal.signal(signal.SIGTERM, self.handle_stop)
+        signal.signal(signal.SIGINT, self.handle_stop)
+        signal.signal(signal.SIGHUP, self.handle_reload)
+        
+        self.email_relay = threading.Thread(
+            target=email_dispatcher.relay, args=(self.email_queue,), name='order-email-relay'
+        )
+        self.email_relay.daemon = True
+        self.email_relay.start()
+        
+        for slot in range(self.workers):
+            self.spawn(slot)
+        logger.info("Supervisor started", extra={"port": self.port, "workers": self.workers})
+        
+        while self.running:
+            if self.reload_requested:
+                self.reload_requested = False
+                self.rolling_restart()
+            self.reap()
+            time.sleep(0.5)
+        
+        self.stop()
+        logger.info("Supervisor stopped")
+
+def run_server(port=5000, workers=WEB_CONCURRENCY):
+    if workers > 1 and not hasattr(socket, 'SO_REUSEPORT'):
+        logger.warning("SO_REUSEPORT not supported, running a single process")
+        workers = 1
+    # Slot counters in memory are only authoritative when one process takes every booking
+    delivery.shared = workers > 1
+    
+    logger.info("AMCMart API server ready", extra={
+        "port": port,
+        "workers": workers,
+        "api_base_url": 'https://amcmart-api.onrender.com/api',
+        "email_configured": bool(SENDER_EMAIL and ADMIN_EMAIL and SENDGRID_API_KEY),
+    })
+    
+    if workers > 1:
+        PreforkSupervisor(port, workers).run()
+        return
+    
+    httpd = APIServer(('', port), APIHandler)
+    db.start_maintenance()
+    snapshot_listener.start()
     httpd.serve_forever()
 
 if __name__ == '__main__':
+    if sys.argv[1:] == ['rebuild-rollups']:
+        db.rebuild_order_rollups()
+        sys.exit(0)
+    
     port = int(os.getenv('PORT', 5000))
     run_server(port)